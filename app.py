@@ -24,9 +24,14 @@
 # - Si no tienes Excel aún, se generan archivos vacíos con encabezados estándar en la primera ejecución.
 
 from flask import (
-    Flask, request, session, redirect, url_for, jsonify, send_file, make_response
+    Flask, request, session, redirect, url_for, jsonify, send_file, make_response, g,
+    Response, stream_with_context
 )
-import os, sys, io, re, json, shutil, datetime, math
+import os, sys, io, re, json, shutil, datetime, math, time, threading, gzip, bisect
+import sqlite3, pickle, unicodedata, random
+from functools import lru_cache
+from string import Template
+import numpy as np
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
@@ -39,6 +44,9 @@ APP_VERSION = "2025.10"
 # --------- Flask ----------
 app = Flask(__name__)
 app.secret_key = os.environ.get("APP_SECRET_KEY", "dev-secret-change-me")
+# Los assets estáticos llevan hash de contenido en la URL (?v=...), así que
+# pueden cachearse un año sin riesgo de servir versiones viejas
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 31536000
 
 # --------- Paths & Archivos persistentes ----------
 USER_DATA_DIR = os.path.join(os.path.expanduser("~"), ".meds_app_data_web")
@@ -54,6 +62,17 @@ EXCEL_PATH       = os.path.join(USER_DATA_DIR, DATA_BASENAME)
 EXCEL_EXTRA_PATH = os.path.join(USER_DATA_DIR, EXTRA_BASENAME)
 EXCEL_DIGEMID_PATH = os.path.join(USER_DATA_DIR, DIGEMID_BASENAME)
 USERS_PATH       = os.path.join(USER_DATA_DIR, USERS_BASENAME)
+# Cache append-only de resultados web (Parquet): el Excel principal queda
+# como fuente de verdad de solo lectura para las búsquedas. Es un directorio
+# de part-files: cada búsqueda añade solo sus filas nuevas, sin releer ni
+# reescribir lo acumulado (WEB_CACHE_PARQUET queda para migrar el archivo
+# único de versiones previas)
+WEB_CACHE_PARQUET = os.path.join(USER_DATA_DIR, "web_cache.parquet")
+WEB_CACHE_DIR = os.path.join(USER_DATA_DIR, "web_cache_pq")
+# Cache sqlite de scrapes por (query, farmacia): queries repetidas dentro del
+# TTL no vuelven a golpear las webs
+WEB_QUERY_CACHE_DB = os.path.join(USER_DATA_DIR, "web_query_cache.db")
+WEB_QUERY_CACHE_TTL = 6 * 3600  # segundos
 
 # --------- Columnas ----------
 BASE_COLUMNS_STD = [
@@ -97,21 +116,43 @@ def _ensure_users():
         with open(USERS_PATH,"w",encoding="utf-8") as f:
             json.dump(default_users, f, indent=2, ensure_ascii=False)
 
+# Cache de usuarios: el JSON se parsea una vez y se recarga solo si cambia
+# el mtime del archivo (save_users lo reescribe y eso invalida el cache)
+_USERS_CACHE = {"mtime": None, "users": [], "map": {}}
+
 def load_users():
     _ensure_users()
+    try:
+        mtime = os.path.getmtime(USERS_PATH)
+    except OSError:
+        mtime = None
+    if mtime is not None and mtime == _USERS_CACHE["mtime"]:
+        return _USERS_CACHE["users"]
     try:
         with open(USERS_PATH,"r",encoding="utf-8") as f:
-            return json.load(f).get("users",[])
+            users = json.load(f).get("users",[])
     except Exception:
-        return [
+        # JSON corrupto/ilegible: poblar también el mapa con los usuarios por
+        # defecto (check_credentials solo lee el mapa) y no fijar mtime para
+        # reintentar el archivo en la próxima llamada
+        users = [
             {"username":"admin","password":"admin","role":"admin"},
             {"username":"consulta","password":"consulta","role":"consulta"},
         ]
+        _USERS_CACHE["mtime"] = None
+        _USERS_CACHE["users"] = users
+        _USERS_CACHE["map"]   = {x.get("username"): (x.get("password"), x.get("role")) for x in users}
+        return users
+    _USERS_CACHE["mtime"] = mtime
+    _USERS_CACHE["users"] = users
+    _USERS_CACHE["map"]   = {x.get("username"): (x.get("password"), x.get("role")) for x in users}
+    return users
 
 def check_credentials(u,p):
-    for x in load_users():
-        if x["username"]==u and x["password"]==p:
-            return x["role"]
+    load_users()  # refresca el cache si el archivo cambió
+    row = _USERS_CACHE["map"].get(u)
+    if row and row[0] == p:
+        return row[1]
     return None
 
 def save_users(users):
@@ -131,14 +172,21 @@ def resource_path(rel: str) -> str:
         base = os.path.abspath(".")
     return os.path.join(base, rel)
 
+_LOGO_EXTS  = (".png",".jpg",".jpeg",".gif",".bmp")
+_LOGO_NAMES = tuple("logo"+e for e in _LOGO_EXTS)
+
 def find_user_logo_path():
-    """Find user's custom logo in USER_DATA_DIR"""
-    for ext in (".png",".jpg",".jpeg",".gif",".bmp"):
-        p = os.path.join(USER_DATA_DIR, "logo"+ext)
-        if os.path.exists(p):
-            return p
+    """Find user's custom logo in USER_DATA_DIR (un solo scandir, no 5 stats)"""
+    try:
+        with os.scandir(USER_DATA_DIR) as it:
+            for entry in it:
+                if entry.name.lower() in _LOGO_NAMES and entry.is_file():
+                    return entry.path
+    except OSError:
+        pass
     return None
 
+@lru_cache(maxsize=1)
 def current_logo_path():
     """Get the best available logo path (user custom > bundled > default)"""
     # First check user's custom logo
@@ -165,11 +213,11 @@ def save_logo(file_storage):
     """Save uploaded logo file, removing any existing logos first"""
     filename = secure_filename(file_storage.filename or "")
     ext = os.path.splitext(filename)[1].lower()
-    if ext not in (".png",".jpg",".jpeg",".gif",".bmp"):
+    if ext not in _LOGO_EXTS:
         raise ValueError("Formato de logo no soportado.")
     
     # Remove any existing logo files
-    for e in (".png",".jpg",".jpeg",".gif",".bmp"):
+    for e in _LOGO_EXTS:
         p = os.path.join(USER_DATA_DIR, "logo"+e)
         if os.path.exists(p):
             try: 
@@ -180,6 +228,7 @@ def save_logo(file_storage):
     # Save new logo
     dst = os.path.join(USER_DATA_DIR, "logo"+ext)
     file_storage.save(dst)
+    current_logo_path.cache_clear()  # el logo resuelto cambió
     return dst
 
 # --------- Carga/normalización de Excel ----------
@@ -204,7 +253,14 @@ def ensure_file_from_bundle_or_local(dst_path, basename, empty_df_columns=None):
     if empty_df_columns is not None:
         pd.DataFrame(columns=empty_df_columns).to_excel(dst_path, index=False)
 
+# ensure_all_files corre en el camino caliente (combo_df la llama en cada
+# búsqueda); una vez preparados los archivos no hay que volver a statearlos
+_FILES_READY = False
+
 def ensure_all_files():
+    global _FILES_READY
+    if _FILES_READY:
+        return
     ensure_file_from_bundle_or_local(EXCEL_PATH, DATA_BASENAME, empty_df_columns=BASE_COLUMNS_STD)
     ensure_file_from_bundle_or_local(EXCEL_EXTRA_PATH, EXTRA_BASENAME, empty_df_columns=BASE_COLUMNS_STD + EXTRA_COLUMNS)
     # Intentar procesar preciosProductos (1).xlsx como base DIGEMID si existe
@@ -229,12 +285,42 @@ def ensure_all_files():
         else:
             ensure_file_from_bundle_or_local(EXCEL_DIGEMID_PATH, DIGEMID_BASENAME, empty_df_columns=BASE_COLUMNS_STD)
     _ensure_users()
+    _FILES_READY = True
+
+# Alias de columnas que realmente consumen normalize_from_main/normalize_from_extra;
+# todo lo demás se descarta al leer para ahorrar memoria e inferencia de tipos
+_WANTED_COLS = {
+    "código producto","codigo producto","cod","codigo","sku",
+    "producto (marca comercial)","producto","marca comercial","nombre",
+    "principio activo","p. activo","activo",
+    "n° digemid","no digemid","numero digemid","registro digemid","n°  digemid",
+    "laboratorio / fabricante","laboratorio","fabricante","proveedor","lab",
+    "presentación","presentacion","contenido",
+    "precio","precio (s/)","precio s/","precio s/.","monto",
+    "farmacia / fuente","farmacia","fuente","botica","cadena","tienda",
+    "enlace","link","url",
+    "grupo","laboratorio abreviado","lab. abreviado","laboratorio abrev",
+    "laboratorio precio","lab precio","lab completo",
+    "nombre del producto",
+}
+
+def _is_wanted_col(name):
+    k = str(name).strip().lower()
+    if k in _WANTED_COLS:
+        return True
+    # Mismo comodín que usa find_key() en normalize_from_extra para el código
+    return ("c" in k or "cod" in k) and "dig" in k
 
 def load_file(path):
     try:
         if str(path).lower().endswith(".csv"):
-            return pd.read_csv(path)
-        return pd.read_excel(path)
+            return pd.read_csv(path, dtype=str, usecols=_is_wanted_col)
+        try:
+            # calamine (Rust) es mucho más rápido que openpyxl para leer xlsx
+            return pd.read_excel(path, engine="calamine", dtype=str, usecols=_is_wanted_col)
+        except (ImportError, ValueError):
+            # Fallback al engine por defecto si calamine no está disponible
+            return pd.read_excel(path, dtype=str, usecols=_is_wanted_col)
     except Exception:
         return pd.DataFrame()
 
@@ -244,31 +330,39 @@ def load_digemid_file(path):
         if str(path).lower().endswith(".csv"):
             # Para CSV, leer desde la línea 8 (skiprows=7)
             return pd.read_csv(path, skiprows=7)
-        else:
-            # Para Excel, leer desde header=7 (línea 8)
+        try:
+            # Para Excel, leer desde header=7 (línea 8); calamine como en load_file
+            return pd.read_excel(path, engine="calamine", header=7)
+        except (ImportError, ValueError):
             return pd.read_excel(path, header=7)
     except Exception as e:
         print(f"Error loading DIGEMID file: {e}")
         return pd.DataFrame()
 
 def df_to_upper(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-    for c in out.columns:
-        out[c] = out[c].astype(str).replace("nan", "")
-    for c in _TEXT_COLS:
-        if c in out.columns:
-            out[c] = out[c].astype(str).str.upper()
-    return out
+    # Muta el frame recibido (siempre llega recién normalizado). El dtype
+    # "string" mantiene los faltantes como <NA> en vez de producir el artefacto
+    # "nan", así fillna("") reemplaza al scan de replace("nan","") y cada
+    # bloque se resuelve en una sola pasada
+    text_cols  = [c for c in _TEXT_COLS if c in df.columns]
+    other_cols = [c for c in df.columns if c not in text_cols]
+    if other_cols:
+        df[other_cols] = df[other_cols].astype("string").fillna("")
+    if text_cols:
+        df[text_cols] = df[text_cols].astype("string").apply(lambda s: s.str.upper()).fillna("")
+    return df
 
+_ACRONYM_RE = re.compile(r"[A-ZÁÉÍÓÚÜÑ]+")
+
+@lru_cache(maxsize=4096)
 def smart_abbrev(text: str, max_len: int = 18) -> str:
     """Create smart abbreviation of text, trying acronym first, then truncation"""
     t = (str(text) or "").strip()
-    if len(t) <= max_len: 
+    if len(t) <= max_len:
         return t
-    
+
     # Try to create acronym from uppercase words
-    import re as _re
-    words = _re.findall(r"[A-ZÁÉÍÓÚÜÑ]+", t.upper())
+    words = _ACRONYM_RE.findall(t.upper())
     acr = "".join(w[0] for w in words) if words else t[:3]
     
     if 3 <= len(acr) <= max_len:
@@ -276,46 +370,57 @@ def smart_abbrev(text: str, max_len: int = 18) -> str:
     else:
         return t[: max_len-1] + "…"
 
+def smart_abbrev_series(s: pd.Series, max_len: int = 18) -> pd.Series:
+    """smart_abbrev vectorizado para una columna completa: los cortos pasan tal
+    cual, el resto prueba acrónimo y cae a truncado, todo en pasadas .str"""
+    s = s.astype("string").fillna("").str.strip()
+    short = s.str.len() <= max_len
+    acr = s.str.upper().str.findall(_ACRONYM_RE).map(
+        lambda ws: "".join(w[0] for w in ws))
+    acr = acr.where(acr.str.len() > 0, s.str.slice(0, 3))
+    acr_ok = (acr.str.len() >= 3) & (acr.str.len() <= max_len)
+    trunc = s.str.slice(0, max_len - 1) + "…"
+    return s.where(short, acr.where(acr_ok, trunc))
+
+def _rename_to_std(raw: pd.DataFrame, pairs) -> pd.DataFrame:
+    """Mapea columnas fuente->estándar con un solo rename+reindex en lugar de
+    construir el frame indexando df[col] una docena de veces (cada acceso
+    copiaba la Series). `pairs` son tuplas (columna_estándar, columna_fuente)."""
+    mapping = {}
+    for dst, src in pairs:
+        if src is not None and src not in mapping:
+            mapping[src] = dst
+    return raw.rename(columns=mapping).reindex(
+        columns=BASE_COLUMNS_STD + EXTRA_COLUMNS, fill_value=""
+    )
+
 def normalize_from_main(raw: pd.DataFrame) -> pd.DataFrame:
-    df = raw.copy()
-    lower = {str(c).strip().lower(): c for c in df.columns}
+    lower = {str(c).strip().lower(): c for c in raw.columns}
     def pick(*cands):
         for c in cands:
             if c in lower: return lower[c]
         return None
-    codigo  = pick("código producto","codigo producto","cod","codigo","sku")
-    prod    = pick("producto (marca comercial)","producto","marca comercial","nombre")
-    prin    = pick("principio activo","p. activo","activo")
-    digemid = pick("n° digemid","no digemid","numero digemid","registro digemid","n°  digemid")
-    lab     = pick("laboratorio / fabricante","laboratorio","fabricante","proveedor","lab")
-    pres    = pick("presentación","presentacion","contenido")
-    precio  = pick("precio","precio (s/)","precio s/","precio s/.","monto")
-    farma   = pick("farmacia / fuente","farmacia","fuente","botica","cadena","tienda")
-    enlace  = pick("enlace","link","url")
-    out = pd.DataFrame({
-        "CÓDIGO PRODUCTO":           df[codigo]  if codigo  in df.columns else "",
-        "Producto (Marca comercial)":df[prod]    if prod    in df.columns else "",
-        "Principio Activo":          df[prin]    if prin    in df.columns else "",
-        "N° DIGEMID":                df[digemid] if digemid in df.columns else "",
-        "Laboratorio / Fabricante":  df[lab]     if lab     in df.columns else "",
-        "Presentación":              df[pres]    if pres    in df.columns else "",
-        "Precio":                    df[precio]  if precio  in df.columns else "",
-        "Farmacia / Fuente":         df[farma]   if farma   in df.columns else "",
-        "Enlace":                    df[enlace]  if enlace  in df.columns else "",
-    })
-    for ex in EXTRA_COLUMNS:
-        out[ex] = df[lower[ex.lower()]] if ex.lower() in lower else ""
+    out = _rename_to_std(raw, [
+        ("CÓDIGO PRODUCTO",            pick("código producto","codigo producto","cod","codigo","sku")),
+        ("Producto (Marca comercial)", pick("producto (marca comercial)","producto","marca comercial","nombre")),
+        ("Principio Activo",           pick("principio activo","p. activo","activo")),
+        ("N° DIGEMID",                 pick("n° digemid","no digemid","numero digemid","registro digemid","n°  digemid")),
+        ("Laboratorio / Fabricante",   pick("laboratorio / fabricante","laboratorio","fabricante","proveedor","lab")),
+        ("Presentación",               pick("presentación","presentacion","contenido")),
+        ("Precio",                     pick("precio","precio (s/)","precio s/","precio s/.","monto")),
+        ("Farmacia / Fuente",          pick("farmacia / fuente","farmacia","fuente","botica","cadena","tienda")),
+        ("Enlace",                     pick("enlace","link","url")),
+    ] + [(ex, lower.get(ex.lower())) for ex in EXTRA_COLUMNS])
     for c in out.columns:
         out[c] = out[c].astype(str).replace("nan", "")
-    out["CÓDIGO PRODUCTO"] = out["CÓDIGO PRODUCTO"].where(
-        out["CÓDIGO PRODUCTO"].astype(str).str.strip() != "", out["N° DIGEMID"]
-    )
-    out["N° DIGEMID"] = out["CÓDIGO PRODUCTO"]
+    _fill_codigo_from_digemid(out)
     return out
 
 def normalize_from_digemid(raw: pd.DataFrame) -> pd.DataFrame:
     """Normalizar DataFrame de DIGEMID mapeando columnas específicas"""
-    df = raw.copy()
+    # Solo lectura sobre `raw`: el resultado se construye en un frame nuevo,
+    # así que la copia defensiva solo duplicaba el pico de RSS del import
+    df = raw
     lower = {str(c).strip().lower(): c for c in df.columns}
     
     def pick(*cands):
@@ -395,39 +500,36 @@ def normalize_from_digemid(raw: pd.DataFrame) -> pd.DataFrame:
     return out
 
 def normalize_from_extra(raw: pd.DataFrame) -> pd.DataFrame:
-    df = raw.copy()
-    lower = {str(c).strip().lower(): c for c in df.columns}
+    lower = {str(c).strip().lower(): c for c in raw.columns}
     def find_key(*alts):
         for a in alts:
             if a in lower: return lower[a]
         for k in list(lower.keys()):
             if ("c" in k or "cod" in k) and "dig" in k: return lower[k]
         return None
-    col_grupo = find_key("grupo")
-    col_cdig  = find_key("códig","codig","còdigo","codigo","código","c¢dig")
-    col_nom   = find_key("nombre del producto","nombre","producto")
-    col_lab_abrev = find_key("laboratorio abreviado","lab. abreviado","laboratorio abrev")
-    col_lab_full  = find_key("laboratorio precio","laboratorio","lab precio","lab completo")
-    out = pd.DataFrame({
-        "CÓDIGO PRODUCTO":           "",
-        "Producto (Marca comercial)":df[col_nom] if col_nom else "",
-        "Principio Activo":          "",
-        "N° DIGEMID":                df[col_cdig] if col_cdig else "",
-        "Laboratorio / Fabricante":  df[col_lab_abrev] if col_lab_abrev else "",
-        "Presentación":              "",
-        "Precio":                    df[find_key("precio")] if find_key("precio") else "",
-        "Farmacia / Fuente":         "",
-        "Enlace":                    "",
-        "GRUPO":                     df[col_grupo] if col_grupo else "",
-        "Laboratorio Abreviado":     df[col_lab_abrev] if col_lab_abrev else "",
-        "LABORATORIO PRECIO":        df[col_lab_full] if col_lab_full else "",
-    })
+    out = _rename_to_std(raw, [
+        ("N° DIGEMID",                 find_key("códig","codig","còdigo","codigo","código","c¢dig")),
+        ("Producto (Marca comercial)", find_key("nombre del producto","nombre","producto")),
+        ("Laboratorio / Fabricante",   find_key("laboratorio abreviado","lab. abreviado","laboratorio abrev")),
+        ("Precio",                     find_key("precio")),
+        ("GRUPO",                      find_key("grupo")),
+        ("LABORATORIO PRECIO",         find_key("laboratorio precio","laboratorio","lab precio","lab completo")),
+    ])
+    # El lab abreviado alimenta ambas columnas (rename no puede duplicar)
+    out["Laboratorio Abreviado"] = out["Laboratorio / Fabricante"]
     for c in out.columns:
         out[c] = out[c].astype(str).replace("nan", "")
     out["CÓDIGO PRODUCTO"] = out["N° DIGEMID"]
     return out
 
 def load_normalized(path, which="main") -> pd.DataFrame:
+    # Sidecar Parquet: evita re-parsear el xlsx (ZIP+XML) en cada arranque frío
+    cache = str(path) + ".parquet"
+    try:
+        if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+            return pd.read_parquet(cache)
+    except Exception:
+        pass  # pyarrow ausente o sidecar corrupto: seguir con el xlsx
     raw = load_file(path)
     if raw.empty:
         return pd.DataFrame(columns=BASE_COLUMNS_STD + EXTRA_COLUMNS)
@@ -435,10 +537,22 @@ def load_normalized(path, which="main") -> pd.DataFrame:
     df_up = df_to_upper(df)
     if "Enlace" in df.columns:
         df_up["Enlace"] = df["Enlace"].astype(str).replace("nan", "")
+    try:
+        df_up.to_parquet(cache, compression="zstd")
+    except Exception:
+        pass
     return df_up
 
 def load_normalized_digemid(path) -> pd.DataFrame:
     """Cargar y normalizar archivo DIGEMID específico"""
+    # Mismo sidecar Parquet que load_normalized: el xlsx DIGEMID es el más
+    # pesado de la app y solo se re-parsea cuando cambia su mtime
+    cache = str(path) + ".parquet"
+    try:
+        if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+            return pd.read_parquet(cache)
+    except Exception:
+        pass
     raw = load_digemid_file(path)
     if raw.empty:
         return pd.DataFrame(columns=BASE_COLUMNS_STD + EXTRA_COLUMNS)
@@ -446,20 +560,65 @@ def load_normalized_digemid(path) -> pd.DataFrame:
     df_up = df_to_upper(df)
     if "Enlace" in df.columns:
         df_up["Enlace"] = df["Enlace"].astype(str).replace("nan", "")
+    try:
+        df_up.to_parquet(cache, compression="zstd")
+    except Exception:
+        pass
     return df_up
 
+def _fill_codigo_from_digemid(df):
+    """Completa CÓDIGO PRODUCTO con N° DIGEMID donde esté vacío y deja ambas
+    columnas sincronizadas, en una sola pasada sobre los arrays subyacentes
+    (evita los astype(str).str.strip() repetidos del .where encadenado)"""
+    if len(df) == 0:
+        return df
+    vals = df["CÓDIGO PRODUCTO"].to_numpy(dtype=object)
+    dig  = df["N° DIGEMID"].to_numpy(dtype=object)
+    empty = np.fromiter((not str(v).strip() for v in vals), dtype=bool, count=len(vals))
+    out = np.where(empty, dig, vals)
+    df["CÓDIGO PRODUCTO"] = out
+    df["N° DIGEMID"] = out
+    return df
+
+# Cache del combinado BASE+EXTRA: se invalida solo cuando cambian los archivos
+def _combo_cache_key():
+    try:
+        web_mtime = 0.0
+        for p in (WEB_CACHE_DIR, WEB_CACHE_PARQUET):
+            try:
+                web_mtime = max(web_mtime, os.path.getmtime(p))
+            except OSError:
+                pass
+        # mtime + tamaño: en sistemas de archivos con mtime de 1 s, un upload
+        # que re-escribe dentro del mismo segundo igual invalida por tamaño
+        return (os.path.getmtime(EXCEL_PATH), os.path.getmtime(EXCEL_EXTRA_PATH),
+                os.path.getsize(EXCEL_PATH), os.path.getsize(EXCEL_EXTRA_PATH),
+                web_mtime)
+    except OSError:
+        return None
+
+@lru_cache(maxsize=2)
+def _combo_df_cached(main_mtime, extra_mtime, main_size, extra_size, web_mtime):
+    # Los mtimes solo actúan como clave de invalidación (admin upload → cambia
+    # el mtime → cache miss); el builder lee siempre de disco
+    return _combo_df_build()
+
 def combo_df():
     ensure_all_files()
+    key = _combo_cache_key()
+    if key is not None:
+        # Copia superficial: los callers solo leen, pero evitamos mutar el cache
+        return _combo_df_cached(*key).copy(deep=False)
+    return _combo_df_build()
+
+def _combo_df_build():
     df_main  = load_normalized(EXCEL_PATH, "main")
     df_extra = load_normalized(EXCEL_EXTRA_PATH, "extra")
 
     for df in (df_main, df_extra):
         if "CÓDIGO PRODUCTO" not in df.columns: df["CÓDIGO PRODUCTO"] = ""
         if "N° DIGEMID" not in df.columns:      df["N° DIGEMID"] = ""
-        df["CÓDIGO PRODUCTO"] = df["CÓDIGO PRODUCTO"].where(
-            df["CÓDIGO PRODUCTO"].astype(str).str.strip() != "", df["N° DIGEMID"]
-        )
-        df["N° DIGEMID"] = df["CÓDIGO PRODUCTO"]
+        _fill_codigo_from_digemid(df)
 
     for ex in EXTRA_COLUMNS:
         if ex not in df_main.columns:  df_main[ex]  = ""
@@ -473,13 +632,145 @@ def combo_df():
     
     # Ensure Laboratorio Abreviado column exists with smart abbreviations
     if "Laboratorio Abreviado" not in df_main.columns:
-        df_main["Laboratorio Abreviado"] = df_main["Laboratorio / Fabricante"].apply(lambda x: smart_abbrev(x, 18))
+        df_main["Laboratorio Abreviado"] = smart_abbrev_series(df_main["Laboratorio / Fabricante"])
     if "Laboratorio Abreviado" not in df_extra.columns:
-        df_extra["Laboratorio Abreviado"] = df_extra["Laboratorio / Fabricante"].apply(lambda x: smart_abbrev(x, 18))
+        df_extra["Laboratorio Abreviado"] = smart_abbrev_series(df_extra["Laboratorio / Fabricante"])
+
+    # Ambos frames son propios (recién cargados): no hace falta copiarlos
+    df_main["_ORIGEN"]  = "BASE"
+    df_extra["_ORIGEN"] = "EXTRA"
+    frames = [df_main, df_extra]
+
+    # Resultados web cacheados (Parquet append-only): se suman al combinado
+    # sin reescribir nunca el Excel principal
+    if _web_cache_nonempty():
+        try:
+            df_web = pd.read_parquet(_web_cache_dataset())
+            if not df_web.empty:
+                df_web = df_web.reindex(columns=BASE_COLUMNS_STD + EXTRA_COLUMNS, fill_value="")
+                df_web = df_web.fillna("")
+                # Evitar duplicar filas que ya migraron al Excel principal
+                dup_keys = ["Producto (Marca comercial)", "Precio", "Farmacia / Fuente"]
+                merged = df_web.merge(df_main[dup_keys].drop_duplicates(),
+                                      on=dup_keys, how="left", indicator=True)
+                df_web = df_web[(merged["_merge"] == "left_only").values]
+                if not df_web.empty:
+                    df_web["_ORIGEN"] = "BASE"
+                    frames.append(df_web)
+        except Exception as e:
+            print(f"[WARN] Could not load web cache: {e}")
+
+    # Concat en Arrow: concat_tables encadena los chunks de cada tabla sin
+    # copiarlos, y el frame resultante ya nace respaldado por buffers Arrow
+    # (el astype de abajo pasa a ser prácticamente un no-op)
+    try:
+        import pyarrow as pa
+        tables = [pa.Table.from_pandas(f, preserve_index=False) for f in frames]
+        df = pa.concat_tables(tables, promote_options="permissive").to_pandas(
+            types_mapper=pd.ArrowDtype)
+    except Exception:
+        df = pd.concat(frames, ignore_index=True)
+    # Todo el texto con dtype Arrow: buffers UTF-8 contiguos en vez de un
+    # PyObject por celda — contains/upper corren en kernels C de pyarrow y
+    # la memoria cae ~2-3x frente a object
+    try:
+        text_cols = [c for c in BASE_COLUMNS_STD + EXTRA_COLUMNS
+                     if c in df.columns and c not in ("Farmacia / Fuente", "GRUPO")]
+        df = df.astype({c: "string[pyarrow]" for c in text_cols})
+    except Exception:
+        pass  # sin pyarrow se sigue con object dtype
+    # Columnas de búsqueda pre-uppercased: el contains por query queda como
+    # un solo escaneo C sin astype(str)/upper por request
+    try:
+        df["_PROD_U"] = df["Producto (Marca comercial)"].astype("string[pyarrow]").str.upper().fillna("")
+        df["_PA_U"]   = df["Principio Activo"].astype("string[pyarrow]").str.upper().fillna("")
+    except Exception:
+        df["_PROD_U"] = df["Producto (Marca comercial)"].astype("string").str.upper().fillna("")
+        df["_PA_U"]   = df["Principio Activo"].astype("string").str.upper().fillna("")
+    # Columna fusionada para el scope "ambos": una sola pasada de contains
+    # sobre producto+activo; el separador "|" corta matches entre bordes
+    df["_ALL_U"] = df["_PROD_U"] + "|" + df["_PA_U"]
+    # Precio cuantizado a céntimos enteros una sola vez al ingestar: ordenar
+    # y min/max comparan ints en vez de re-parsear el string por fila
+    try:
+        df["_PRICE_CENTS"] = df["Precio"].map(_price_cents).astype("int64")
+    except Exception:
+        df["_PRICE_CENTS"] = -1
+    # Columnas de cardinalidad baja dictionary-encoded (category): los
+    # filtros de igualdad/isin comparan códigos enteros, no strings
+    for c in ("Farmacia / Fuente", "GRUPO", "_ORIGEN"):
+        try:
+            df[c] = df[c].astype("category")
+        except Exception:
+            pass
+    return df
+
+@lru_cache(maxsize=2)
+def _combo_ngram_index(main_mtime, extra_mtime, main_size, extra_size, web_mtime):
+    """Índice invertido de 3-gramas sobre las columnas de búsqueda: un query
+    se resuelve intersectando posting lists en vez de escanear todo el frame"""
+    try:
+        df = _combo_df_cached(main_mtime, extra_mtime, main_size, extra_size, web_mtime)
+        index = {}
+        for col in ("_PROD_U", "_PA_U"):
+            post = {}
+            for i, s in enumerate(df[col].tolist()):
+                s = s or ""
+                for j in range(len(s) - 2):
+                    g = s[j:j+3]
+                    bucket = post.get(g)
+                    if bucket is None:
+                        post[g] = bucket = set()
+                    bucket.add(i)
+            index[col] = post
+        return index
+    except Exception as e:
+        print(f"[WARN] Could not build ngram index: {e}")
+        return None
 
-    a = df_main.copy();  a["_ORIGEN"]="BASE"
-    b = df_extra.copy(); b["_ORIGEN"]="EXTRA"
-    return pd.concat([a, b], ignore_index=True)
+def combo_ngram_index():
+    key = _combo_cache_key()
+    return _combo_ngram_index(*key) if key is not None else None
+
+def _contains_filter(df, qU, cols):
+    """Filtrado por substring: con query >= 3 chars usa el índice de 3-gramas
+    (candidatos O(matches)) y verifica con str.contains solo esas filas"""
+    # Con más de una columna se verifica contra la fusionada _ALL_U: un solo
+    # escaneo C en vez de una pasada por columna + OR de máscaras
+    fused = "_ALL_U" if len(cols) > 1 and "_ALL_U" in df.columns else None
+    index = combo_ngram_index() if len(qU) >= 3 else None
+    if index is not None:
+        cand = set()
+        for col in cols:
+            post = index.get(col, {})
+            lists = [post.get(qU[i:i+3]) for i in range(len(qU) - 2)]
+            if not lists or any(l is None for l in lists):
+                continue  # algún 3-grama no existe -> sin matches en esta columna
+            lists.sort(key=len)
+            inter = set(lists[0])
+            for l in lists[1:]:
+                inter &= l
+                if not inter:
+                    break
+            cand |= inter
+        if not cand:
+            return df.iloc[0:0]
+        sub = df.iloc[sorted(cand)]
+        if fused is not None:
+            return sub[sub[fused].str.contains(qU, regex=False, na=False)]
+        mask = None
+        for col in cols:
+            m = sub[col].str.contains(qU, regex=False, na=False)
+            mask = m if mask is None else (mask | m)
+        return sub[mask]
+    # Query corto o sin índice: escaneo vectorizado completo
+    if fused is not None:
+        return df[df[fused].str.contains(qU, regex=False, na=False)]
+    mask = None
+    for col in cols:
+        m = df[col].str.contains(qU, regex=False, na=False)
+        mask = m if mask is None else (mask | m)
+    return df[mask]
 
 def combo_digemid_df():
     """Cargar y combinar todos los archivos DIGEMID"""
@@ -494,10 +785,7 @@ def combo_digemid_df():
         df_digemid["CÓDIGO PRODUCTO"] = ""
     if "N° DIGEMID" not in df_digemid.columns:      
         df_digemid["N° DIGEMID"] = ""
-    df_digemid["CÓDIGO PRODUCTO"] = df_digemid["CÓDIGO PRODUCTO"].where(
-        df_digemid["CÓDIGO PRODUCTO"].astype(str).str.strip() != "", df_digemid["N° DIGEMID"]
-    )
-    df_digemid["N° DIGEMID"] = df_digemid["CÓDIGO PRODUCTO"]
+    _fill_codigo_from_digemid(df_digemid)
     
     for ex in EXTRA_COLUMNS:
         if ex not in df_digemid.columns: 
@@ -506,7 +794,7 @@ def combo_digemid_df():
     if "LABORATORIO PRECIO" not in df_digemid.columns:
         df_digemid["LABORATORIO PRECIO"] = df_digemid["Laboratorio / Fabricante"]
     if "Laboratorio Abreviado" not in df_digemid.columns:
-        df_digemid["Laboratorio Abreviado"] = df_digemid["Laboratorio / Fabricante"].apply(lambda x: smart_abbrev(x, 18))
+        df_digemid["Laboratorio Abreviado"] = smart_abbrev_series(df_digemid["Laboratorio / Fabricante"])
     
     df_digemid["_ORIGEN"] = "DIGEMID"
     return df_digemid
@@ -515,18 +803,184 @@ def combo_digemid_df():
 # User-Agent actualizado para mayor compatibilidad (Chrome 142)
 UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
       "(KHTML, like Gecko) Chrome/142.0.7444.60 Safari/537.36")
-HDRS = {"User-Agent": UA, "Accept-Language":"es-PE,es;q=0.9,en;q=0.8"}
+HDRS = {"User-Agent": UA, "Accept-Language":"es-PE,es;q=0.9,en;q=0.8",
+        "Accept-Encoding":"gzip, deflate, br"}
+
+# Pool pequeño de User-Agents para rotar entre requests
+UA_POOL = [
+    UA,
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+     "(KHTML, like Gecko) Chrome/141.0.7390.54 Safari/537.36"),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+     "(KHTML, like Gecko) Chrome/142.0.7444.60 Safari/537.36"),
+    ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+     "(KHTML, like Gecko) Chrome/141.0.7390.54 Safari/537.36"),
+]
+
+# Session compartida: keep-alive + pool de conexiones evita repetir el
+# handshake TCP+TLS en cada request al mismo host
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+SESSION = requests.Session()
+SESSION.headers.update(HDRS)
+# 429 no va en status_forcelist: polite_get ya aplica su propio backoff por
+# host ante throttling y ambas capas reintentando a la vez apilan esperas
+_adapter = HTTPAdapter(pool_connections=64, pool_maxsize=64,
+                       max_retries=Retry(total=2, backoff_factor=0.3,
+                                         status_forcelist=[502, 503, 504]))
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+# Cortesía por host: máximo 2 requests simultáneos al mismo dominio,
+# backoff exponencial ante 202/429 y cool-down de 60s tras 3 tandas
+# throttled seguidas — el fan-out paralelo no debe provocar bloqueos de IP
+_HOST_LOCK = threading.Lock()
+_HOST_SEMS = {}       # host -> threading.Semaphore(2)
+_HOST_FAILS = {}      # host -> tandas throttled consecutivas
+_HOST_COOLDOWN = {}   # host -> timestamp hasta el que se omite
+
+def _host_sem(host):
+    with _HOST_LOCK:
+        sem = _HOST_SEMS.get(host)
+        if sem is None:
+            sem = _HOST_SEMS[host] = threading.Semaphore(2)
+        return sem
+
+def polite_get(url, **kwargs):
+    """SESSION.get con límite por host, UA rotado y backoff ante throttling"""
+    host = urlparse(url).netloc
+    if time.time() < _HOST_COOLDOWN.get(host, 0):
+        raise requests.exceptions.ConnectionError(f"host {host} en cool-down por throttling")
+    headers = dict(kwargs.pop("headers", None) or {})
+    headers.setdefault("User-Agent", random.choice(UA_POOL))
+    backoff = 1.0
+    with _host_sem(host):
+        for _ in range(3):
+            r = SESSION.get(url, headers=headers, **kwargs)
+            if r.status_code not in (202, 429):
+                with _HOST_LOCK:
+                    _HOST_FAILS.pop(host, None)
+                return r
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+    with _HOST_LOCK:
+        fails = _HOST_FAILS.get(host, 0) + 1
+        if fails >= 3:
+            _HOST_COOLDOWN[host] = time.time() + 60
+            _HOST_FAILS.pop(host, None)
+            print(f"    [WARN] {host}: throttling persistente, cool-down 60s")
+        else:
+            _HOST_FAILS[host] = fails
+    return r
+
+# re2 (google-re2): motor con matching garantizado O(n) — inmune al
+# backtracking patológico de `re` sobre HTML renderizado adversarial.
+# Opcional: si no está instalado se usa `re` con la misma API
+try:
+    import re2 as _re2
+except ImportError:
+    _re2 = None
+
+def compile_linear(pattern: str, flags: int = 0):
+    """Compila con re2 si está disponible (lineal en el peor caso); cae a `re`.
+    re2 no acepta flags numéricos ni lookaheads: IGNORECASE va inline."""
+    if _re2 is not None:
+        try:
+            pat = pattern
+            if flags & re.IGNORECASE:
+                pat = "(?i)" + pat
+            return _re2.compile(pat)
+        except Exception:
+            pass
+    return re.compile(pattern, flags)
+
+# Driver Selenium persistente: levantar Chrome (y resolver ChromeDriver)
+# cuesta segundos por query y es puro overhead — se reutiliza un singleton.
+# El lock serializa su uso porque el driver no es thread-safe
+_DRIVER = None
+_DRIVER_LOCK = threading.Lock()
+
+def _get_driver():
+    """Devuelve el Chrome headless compartido, creándolo la primera vez.
+    Llamar con _DRIVER_LOCK tomado."""
+    global _DRIVER
+    if _DRIVER is not None:
+        return _DRIVER
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    # Driver manager para asegurar ChromeDriver disponible
+    try:
+        from selenium.webdriver.chrome.service import Service
+        from webdriver_manager.chrome import ChromeDriverManager
+        _service = Service(ChromeDriverManager().install())
+    except Exception:
+        _service = None
+
+    chrome_options = Options()
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1366,768")
+    chrome_options.add_argument(f"--user-agent={UA}")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    # No cargar imágenes/CSS/fuentes: el precio está en el DOM igual y la
+    # mayoría de los bytes de un ecommerce son subrecursos visuales
+    chrome_options.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.stylesheets": 2,
+        "profile.managed_default_content_settings.fonts": 2,
+    })
+    # Volver de driver.get() en DOMContentLoaded en vez del load completo
+    chrome_options.page_load_strategy = 'eager'
+
+    _DRIVER = webdriver.Chrome(service=_service, options=chrome_options) if _service else webdriver.Chrome(options=chrome_options)
+    import atexit
+    atexit.register(_shutdown_driver)
+    return _DRIVER
+
+def _shutdown_driver():
+    """Cierra el driver compartido (en errores irrecuperables o al salir)."""
+    global _DRIVER
+    if _DRIVER is not None:
+        try:
+            _DRIVER.quit()
+        except Exception:
+            pass
+        _DRIVER = None
 
 # Improved price regex patterns for Peruvian pharmacies
 RE_PRICE_PATTERNS = [
-    re.compile(r"S/\.?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)", re.IGNORECASE),
-    re.compile(r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*S/\.?", re.IGNORECASE),
-    re.compile(r"Precio[:\s]*S/\.?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)", re.IGNORECASE),
-    re.compile(r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*soles?", re.IGNORECASE),
-    re.compile(r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*PEN", re.IGNORECASE),
-    re.compile(r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)", re.IGNORECASE),  # Generic number pattern
+    compile_linear(r"S/\.?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)", re.IGNORECASE),
+    compile_linear(r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*S/\.?", re.IGNORECASE),
+    compile_linear(r"Precio[:\s]*S/\.?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)", re.IGNORECASE),
+    compile_linear(r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*soles?", re.IGNORECASE),
+    compile_linear(r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*PEN", re.IGNORECASE),
 ]
 
+# Regex para quitar el precio de una línea al buscar el nombre del producto
+RE_PRICE_STRIP = compile_linear(r"S/\.?\s*\d+[.,]?\d*")
+
+# Colapsar espacios al limpiar nombres de producto: str.split sin args es
+# un loop C sin pasar por el motor de regex
+def _collapse_ws(s: str) -> str:
+    return ' '.join(s.split())
+
+# Tokens numéricos de una línea (para mapear línea -> precio encontrado)
+RE_NUM_TOKEN = compile_linear(r"\d[\d.,]*")
+
+@lru_cache(maxsize=32)
+def _skip_words_re(words: tuple):
+    return compile_linear("|".join(re.escape(w) for w in words), re.IGNORECASE)
+
+def has_skip_word(text: str, words: tuple) -> bool:
+    """Equivale a any(w in text.lower() for w in words) pero con una sola
+    alternación compilada (un escaneo del texto, sin .lower() intermedio)"""
+    return _skip_words_re(words).search(text) is not None
+
 # Real Peruvian pharmacy websites with specific search URLs and selectors
 PERUVIAN_PHARMACIES = [
     {
@@ -762,26 +1216,215 @@ PERUVIAN_PHARMACIES = [
     }
 ]
 
+# Pool de procesos para el parseo CPU-bound (BS4 + regex) de páginas ya
+# descargadas: el parseo no suelta el GIL, así que los hilos no escalan.
+# Se crea perezosamente para no pagar el fork en cada arranque de worker
+_PARSE_POOL = None
+_PARSE_POOL_LOCK = threading.Lock()
+
+def _get_parse_pool():
+    global _PARSE_POOL
+    if _PARSE_POOL is None:
+        with _PARSE_POOL_LOCK:
+            if _PARSE_POOL is None:
+                try:
+                    from concurrent.futures import ProcessPoolExecutor
+                    _PARSE_POOL = ProcessPoolExecutor(max_workers=os.cpu_count() or 2)
+                except Exception as e:
+                    print(f"[WARN] ProcessPoolExecutor no disponible: {e}")
+                    _PARSE_POOL = False  # no reintentar en cada llamada
+    return _PARSE_POOL or None
+
+# Cache TTL para resultados de buscadores: una consulta repetida durante la
+# sesión no vuelve a pagar el RTT a DuckDuckGo/Google
+_SEARCH_CACHE = {}
+_SEARCH_CACHE_LOCK = threading.Lock()  # Flask atiende en varios hilos
+_SEARCH_CACHE_TTL = 600   # segundos
+_SEARCH_CACHE_MAX = 512
+
+def _search_cache_get(key):
+    with _SEARCH_CACHE_LOCK:
+        hit = _SEARCH_CACHE.get(key)
+        if hit is None:
+            return None
+        ts, value = hit
+        if time.time() - ts < _SEARCH_CACHE_TTL:
+            return value
+        _SEARCH_CACHE.pop(key, None)
+    return None
+
+def _search_cache_put(key, value):
+    now = time.time()
+    with _SEARCH_CACHE_LOCK:
+        if len(_SEARCH_CACHE) >= _SEARCH_CACHE_MAX:
+            # Purga: primero lo expirado, luego lo más antiguo
+            for k in [k for k, (ts, _) in _SEARCH_CACHE.items() if now - ts >= _SEARCH_CACHE_TTL]:
+                _SEARCH_CACHE.pop(k, None)
+            while len(_SEARCH_CACHE) >= _SEARCH_CACHE_MAX:
+                _SEARCH_CACHE.pop(next(iter(_SEARCH_CACHE)))
+        _SEARCH_CACHE[key] = (now, value)
+
+# Cache LRU de páginas descargadas por URL (TTL 1h): los mismos enlaces de
+# DDG/Google se repiten entre búsquedas de medicamentos comunes y la página
+# de producto casi no cambia dentro de la hora
+from collections import OrderedDict
+_PAGE_CACHE = OrderedDict()
+_PAGE_CACHE_LOCK = threading.Lock()
+_PAGE_CACHE_TTL = 3600
+_PAGE_CACHE_MAX = 64
+
+def _page_cache_get(url):
+    with _PAGE_CACHE_LOCK:
+        hit = _PAGE_CACHE.get(url)
+        if hit is None:
+            return None
+        ts, html = hit
+        if time.time() - ts < _PAGE_CACHE_TTL:
+            _PAGE_CACHE.move_to_end(url)
+            return html
+        _PAGE_CACHE.pop(url, None)
+    return None
+
+def _page_cache_put(url, html):
+    with _PAGE_CACHE_LOCK:
+        _PAGE_CACHE[url] = (time.time(), html)
+        _PAGE_CACHE.move_to_end(url)
+        while len(_PAGE_CACHE) > _PAGE_CACHE_MAX:
+            _PAGE_CACHE.popitem(last=False)
+
+# --------- Descarga concurrente (asyncio + aiohttp) ----------
+import asyncio
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+# httpx preferido: multiplexa sobre HTTP/2 (una conexión para varios GETs
+# al mismo host) y comparte el pool durante todo el gather
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+async def _fetch_async(session, url, timeout, sem):
+    async with sem:
+        try:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                if resp.status == 200:
+                    return url, await resp.text()
+                print(f"    [ERROR] async fetch {url}: HTTP {resp.status}")
+        except Exception as e:
+            print(f"    [ERROR] async fetch {url}: {e}")
+        return url, None
+
+def fetch_urls_concurrently(urls, timeout=10, max_conc=8):
+    """Descarga varias URLs en paralelo y devuelve {url: html|None}.
+    Las URLs con página cacheada (TTL 1h) no gastan presupuesto HTTP."""
+    urls = list(urls)
+    cached = {u: _page_cache_get(u) for u in urls}
+    pending = [u for u, h in cached.items() if h is None]
+    out = {u: h for u, h in cached.items() if h is not None}
+    if pending:
+        fetched = _fetch_urls_uncached(pending, timeout=timeout, max_conc=max_conc)
+        for u, h in fetched.items():
+            if h:
+                _page_cache_put(u, h)
+        out.update(fetched)
+    return out
+
+def _fetch_urls_uncached(urls, timeout=10, max_conc=8):
+    """Descarga real: httpx (HTTP/2) > aiohttp > bucle serial con requests.
+    La latencia pasa de la suma de RTTs al máximo de ellos."""
+    if not urls:
+        return {}
+
+    if httpx is not None:
+        async def _run_httpx():
+            sem = asyncio.Semaphore(max_conc)
+            # Máximo 2 requests simultáneos por host también en el camino async
+            host_sems = {}
+
+            def _hsem(u):
+                h = urlparse(u).netloc
+                if h not in host_sems:
+                    host_sems[h] = asyncio.Semaphore(2)
+                return host_sems[h]
+
+            async def _one(client, u):
+                async with sem, _hsem(u):
+                    try:
+                        backoff = 1.0
+                        for _ in range(3):
+                            r = await client.get(u)
+                            if r.status_code in (202, 429):
+                                await asyncio.sleep(backoff)
+                                backoff = min(backoff * 2, 30)
+                                continue
+                            if r.status_code == 200:
+                                return u, r.text
+                            break
+                        print(f"    [ERROR] async fetch {u}: HTTP {r.status_code}")
+                    except Exception as e:
+                        print(f"    [ERROR] async fetch {u}: {e}")
+                    return u, None
+
+            async with httpx.AsyncClient(http2=True, headers=HDRS,
+                                         timeout=timeout, follow_redirects=True) as client:
+                pairs = await asyncio.gather(*[_one(client, u) for u in urls])
+            return dict(pairs)
+
+        try:
+            return asyncio.run(_run_httpx())
+        except Exception as e:
+            # p.ej. h2 no instalado: seguir con aiohttp o el bucle serial
+            print(f"    [WARN] httpx no disponible/funcionó: {e}")
+
+    if aiohttp is None:
+        out = {}
+        for u in urls:
+            try:
+                r = polite_get(u, timeout=timeout)
+                out[u] = r.text if r.status_code == 200 else None
+            except Exception as e:
+                print(f"    [ERROR] fetch {u}: {e}")
+                out[u] = None
+        return out
+
+    async def _run():
+        sem = asyncio.Semaphore(max_conc)
+        async with aiohttp.ClientSession(headers=HDRS) as session:
+            pairs = await asyncio.gather(*[_fetch_async(session, u, timeout, sem) for u in urls])
+        return dict(pairs)
+
+    return asyncio.run(_run())
+
 def ddg_results(q, max_urls=15, timeout=10):
     """Get search results from DuckDuckGo"""
-    try:
-        from bs4 import BeautifulSoup
-    except ImportError:
-        return []
-    
+    cache_key = ("ddg", q, max_urls)
+    cached = _search_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         url = "https://duckduckgo.com/html/"
         params = {"q": f"{q} precio farmacia peru comprar"}
-        r = requests.get(url, params=params, headers=HDRS, timeout=timeout)
+        r = polite_get(url, params=params, timeout=(3, timeout))  # (connect, read)
         r.raise_for_status()
-        soup = BeautifulSoup(r.text, "lxml")
+        # Lexbor parsea la página de resultados en milisegundos; BS4 queda
+        # como fallback igual que en html_to_text
+        if LexborHTMLParser is not None:
+            hrefs = (a.attributes.get("href")
+                     for a in LexborHTMLParser(r.text).css("a.result__a[href]"))
+        else:
+            hrefs = (a.get("href")
+                     for a in BeautifulSoup(r.text, "lxml").select("a.result__a[href]"))
         out = []
-        for a in soup.select("a.result__a[href]"):
-            href = a.get("href")
+        for href in hrefs:
             if href and href.startswith("http"):
                 out.append(href)
             if len(out) >= max_urls:
                 break
+        if out:  # no cachear fallos transitorios (lista vacía)
+            _search_cache_put(cache_key, out)
         return out
     except Exception as e:
         print(f"Error in ddg_results: {e}")
@@ -789,11 +1432,11 @@ def ddg_results(q, max_urls=15, timeout=10):
 
 def google_results(q, max_urls=15, timeout=10):
     """Get search results from Google"""
-    try:
-        from bs4 import BeautifulSoup
-    except ImportError:
-        return []
-    
+    cache_key = ("google", q, max_urls)
+    cached = _search_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
         url = "https://www.google.com/search"
         params = {
@@ -802,122 +1445,370 @@ def google_results(q, max_urls=15, timeout=10):
             "hl": "es",
             "gl": "pe"
         }
-        r = requests.get(url, params=params, headers=HDRS, timeout=timeout)
+        r = polite_get(url, params=params, timeout=(3, timeout))  # (connect, read)
         r.raise_for_status()
-        soup = BeautifulSoup(r.text, "lxml")
         out = []
-        
-        # Try different selectors for Google results
+
+        # Try different selectors for Google results. El filtro "google" del
+        # loop ya descarta enlaces internos, así que el :not() es redundante
         selectors = [
             "div.g a[href^='http']",
-            "a[href^='http']:not([href*='google'])",
+            "a[href^='http']",
             ".yuRUbf a[href^='http']"
         ]
-        
+
+        tree = LexborHTMLParser(r.text) if LexborHTMLParser is not None else None
+        soup = BeautifulSoup(r.text, "lxml") if tree is None else None
         for selector in selectors:
-            for a in soup.select(selector):
-                href = a.get("href")
+            if tree is not None:
+                anchors = (a.attributes.get("href") for a in tree.css(selector))
+            else:
+                anchors = (a.get("href") for a in soup.select(selector))
+            for href in anchors:
                 if href and href.startswith("http") and "google" not in href:
                     out.append(href)
                 if len(out) >= max_urls:
                     break
             if len(out) >= max_urls:
                 break
+        if out:
+            _search_cache_put(cache_key, out)
         return out
     except Exception as e:
         print(f"Error in google_results: {e}")
         return []
 
+# Scanner Hyperscan opcional: DFA JIT que recorre páginas largas en una sola
+# pasada en lugar de N pasadas de `re`; si la librería no está, se usa `re`
+try:
+    import hyperscan as _hs
+    # Todos los patrones están anclados a moneda, así el prefiltro solo marca
+    # regiones con pinta de precio y no cualquier dígito de la página
+    _HS_PRICE_PATTERNS = RE_PRICE_PATTERNS + [
+        re.compile(r"PEN\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)", re.IGNORECASE),
+    ]
+    _HS_DB = _hs.Database()
+    _HS_DB.compile(
+        expressions=[p.pattern.encode() for p in _HS_PRICE_PATTERNS],
+        ids=list(range(len(_HS_PRICE_PATTERNS))),
+        flags=[_hs.HS_FLAG_CASELESS | _hs.HS_FLAG_SOM_LEFTMOST] * len(_HS_PRICE_PATTERNS),
+    )
+except Exception:
+    _HS_DB = None
+
+def scan_price_spans(data: bytes):
+    """Escanea `data` con Hyperscan y devuelve spans (start, end) candidatos.
+    Devuelve None si Hyperscan no está disponible (el caller usa `re`)."""
+    if _HS_DB is None:
+        return None
+    spans = []
+    def _on_match(pat_id, start, end, flags, ctx):
+        spans.append((start, end))
+    try:
+        _HS_DB.scan(data, match_event_handler=_on_match)
+    except Exception:
+        return None
+    return spans
+
+# Alternación única que cubre los patrones de RE_PRICE_PATTERNS en una pasada:
+# moneda opcional antes (S/, Precio: S/) o después (S/, soles, PEN) del número.
+# El sufijo es un lookahead (no consume): así un "S/" pegado al número sigue
+# disponible como prefijo del precio siguiente en texto concatenado
+RE_PRICE_ALL = re.compile(
+    r"(?:(?P<cur>S/\.?|Precio[:\s]*S/\.?|PEN)\s*)?"
+    r"(?P<num>\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)"
+    r"(?=\s*(?P<cur2>S/\.?|soles?|PEN))?",
+    re.IGNORECASE)
+
 def normalize_price(s: str) -> str:
     """Extract and normalize price from text"""
     if not s:
         return ""
-    
+
     s = s.replace("\xa0", " ").replace("\n", " ").strip()
-    
-    # Try different price patterns
-    for pattern in RE_PRICE_PATTERNS:
-        match = pattern.search(s)
-        if match:
-            price_str = match.group(1)
-            # Clean up the price
-            price_str = price_str.replace(",", ".")
-            # Ensure it's a valid price
-            try:
-                price_num = float(price_str)
-                if 0.01 <= price_num <= 10000:  # Reasonable price range
-                    return f"S/ {price_str}"
-            except ValueError:
-                continue
-    
-    return ""
+
+    # Una sola pasada: preferir moneda antes del número (S/ 12.50) y si no,
+    # moneda después (12.50 soles). Los números sin moneda no cuentan: ese
+    # fallback genérico solo producía falsos precios desde cualquier dígito
+    best_suffix = ""
+    for match in RE_PRICE_ALL.finditer(s):
+        if not (match.group("cur") or match.group("cur2")):
+            continue
+        price_str = match.group("num").replace(",", ".")
+        try:
+            price_num = float(price_str)
+        except ValueError:
+            continue
+        if not (0.01 <= price_num <= 10000):  # Reasonable price range
+            continue
+        if match.group("cur"):
+            return f"S/ {price_str}"
+        if not best_suffix:
+            best_suffix = f"S/ {price_str}"
+    return best_suffix
+
+# Parser Lexbor (selectolax): parsea y extrae texto ~10-30x más rápido que
+# BeautifulSoup+soupsieve; opcional, con fallback a BS4 si no está instalado
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Cache de texto extraído keyed por hash del HTML: el mismo documento se
+# re-procesa cuando los selectores encuentran poco y se cae a texto
+# (digest corto en vez del HTML entero como key: las páginas son grandes)
+import hashlib
+from collections import OrderedDict
+_TEXT_CACHE = OrderedDict()
+_TEXT_CACHE_MAX = 64
+
+def html_to_text(html: str) -> str:
+    """Texto plano de una página sin script/style/nav/footer/header"""
+    key = hashlib.blake2b(html.encode("utf-8", "ignore"), digest_size=16).digest()
+    cached = _TEXT_CACHE.get(key)
+    if cached is not None:
+        _TEXT_CACHE.move_to_end(key)
+        return cached
+    text = _html_to_text_uncached(html)
+    _TEXT_CACHE[key] = text
+    if len(_TEXT_CACHE) > _TEXT_CACHE_MAX:
+        _TEXT_CACHE.popitem(last=False)
+    return text
+
+# XPath compilado que saca los nodos de texto excluyendo los ancestros no
+# deseados en una sola pasada C (sin decompose + get_text, dos recorridos)
+try:
+    import lxml.etree as _lxml_etree
+    import lxml.html as _lxml_html
+    _TEXT_XPATH = _lxml_etree.XPath(
+        "//text()[not(ancestor::script or ancestor::style or ancestor::nav"
+        " or ancestor::footer or ancestor::header)]")
+except Exception:
+    _TEXT_XPATH = None
+
+def _html_to_text_uncached(html: str) -> str:
+    if LexborHTMLParser is not None:
+        try:
+            tree = LexborHTMLParser(html)
+            tree.strip_tags(["script", "style", "nav", "footer", "header"])
+            node = tree.body or tree.root
+            if node is not None:
+                return node.text(separator="\n")
+        except Exception:
+            pass
+    if _TEXT_XPATH is not None:
+        try:
+            doc = _lxml_html.fromstring(html)
+            return "\n".join(str(t) for t in _TEXT_XPATH(doc))
+        except Exception:
+            pass
+    try:
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, "lxml")
+        for script in soup(["script", "style", "nav", "footer", "header"]):
+            script.decompose()
+        return soup.get_text()
+    except Exception:
+        return html
+
+try:
+    from bs4 import SoupStrainer as _SoupStrainer
+except ImportError:
+    _SoupStrainer = None
+
+# Aho-Corasick para testear todos los tokens de selectores contra un
+# class/id en una sola pasada; opcional, con fallback a una alternación
+try:
+    import ahocorasick as _ahocorasick
+except ImportError:
+    _ahocorasick = None
+
+def _substring_matcher(tokens):
+    """Callable s -> bool: ¿contiene s alguno de los tokens (sin caso)?"""
+    tokens = [t.lower() for t in set(tokens)]
+    if _ahocorasick is not None and tokens:
+        try:
+            automaton = _ahocorasick.Automaton()
+            for t in tokens:
+                automaton.add_word(t, t)
+            automaton.make_automaton()
+            def _match(s, _a=automaton):
+                for _ in _a.iter(s.lower()):
+                    return True
+                return False
+            return _match
+        except Exception:
+            pass
+    rx = compile_linear("|".join(re.escape(t) for t in tokens) or r"(?!)", re.IGNORECASE)
+    return lambda s: rx.search(s) is not None
+
+if _SoupStrainer is not None:
+    class _SelectorStrainer(_SoupStrainer):
+        """Strainer derivado de los selectores CSS de una farmacia: el parser
+        solo materializa los tags cuyo nombre/clase/id puede matchear algún
+        selector (más sus descendientes), en vez del DOM completo."""
+        def __init__(self, names, token_match):
+            super().__init__()
+            self._names = names
+            self._token_match = token_match
+
+        def _allow(self, name, attrs):
+            if name in self._names:
+                return True
+            if attrs:
+                cls = attrs.get("class") or ""
+                if isinstance(cls, (list, tuple)):
+                    cls = " ".join(cls)
+                if cls and self._token_match(cls):
+                    return True
+                tid = attrs.get("id") or ""
+                if tid and self._token_match(tid):
+                    return True
+            return False
+
+        # bs4 >= 4.13
+        def allow_tag_creation(self, nsprefix, name, attrs):
+            return self._allow(name, attrs or {})
+
+        # bs4 < 4.13
+        def search_tag(self, markup_name=None, markup_attrs={}):
+            return self._allow(markup_name, markup_attrs or {})
+
+def _joined_selector(pharmacy_info: dict, key: str, default: list):
+    """Selector CSS único (unión por comas) precompilado con soupsieve y
+    cacheado en el dict de la farmacia: una sola pasada por el DOM en vez
+    de una por selector. Devuelve None si no se pudo compilar."""
+    cache_key = "_%s_compiled" % key
+    compiled = pharmacy_info.get(cache_key)
+    if compiled is None:
+        try:
+            import soupsieve
+            compiled = soupsieve.compile(", ".join(pharmacy_info.get(key, default)))
+        except Exception:
+            compiled = False  # no recompilar en cada página
+        pharmacy_info[cache_key] = compiled
+    return compiled or None
+
+_STRAINER_CACHE = {}
+_SEL_BARE_TAG_RE = re.compile(r"[a-zA-Z][\w-]*$")
+_SEL_TOKEN_RE = re.compile(r"(?:\.|#|\[(?:class|id)\*?=['\"]?)([\w-]+)")
+
+def _pharmacy_strainer(pharmacy_info: dict):
+    """Strainer cacheado por farmacia, o None si algún selector no se puede
+    traducir a nombre-de-tag/substring (en ese caso se parsea todo)."""
+    name = pharmacy_info.get("name", "")
+    if name in _STRAINER_CACHE:
+        return _STRAINER_CACHE[name]
+    strainer = None
+    if _SoupStrainer is not None:
+        try:
+            selectors = list(pharmacy_info.get("product_selectors", [])) + \
+                        list(pharmacy_info.get("price_selectors", []))
+            names, tokens = set(), []
+            ok = bool(selectors)
+            for sel in selectors:
+                if _SEL_BARE_TAG_RE.fullmatch(sel):
+                    names.add(sel.lower())
+                    continue
+                found = _SEL_TOKEN_RE.findall(sel)
+                if not found:
+                    ok = False  # selector no traducible: no recortar el parse
+                    break
+                tokens.extend(found)
+            if ok:
+                strainer = _SelectorStrainer(names, _substring_matcher(tokens))
+        except Exception:
+            strainer = None
+    _STRAINER_CACHE[name] = strainer
+    return strainer
 
 def extract_multiple_products(html: str, base_url: str, pharmacy_info: dict) -> list:
     """Extract multiple products from a search results page"""
     products = []
+
+    # Check if this pharmacy uses ONLY text extraction (skip selectors):
+    # en ese caso no hace falta construir el árbol BS4 completo
+    if pharmacy_info.get("use_text_extraction", False):
+        print(f"    [TEXT] Using text extraction only for {pharmacy_info['name']} (Angular/React app)")
+        # Obtener query del contexto si está disponible
+        query = pharmacy_info.get("_current_query", "")
+        return extract_products_from_text(html_to_text(html), base_url, pharmacy_info, query=query)
+
     try:
         from bs4 import BeautifulSoup
     except ImportError:
         return products
-    
+
     try:
-        soup = BeautifulSoup(html, "lxml")
-        
+        # Parse parcial: solo los subárboles que los selectores pueden
+        # matchear (menos nodos, menos memoria); fallback al árbol completo
+        strainer = _pharmacy_strainer(pharmacy_info)
+        if strainer is not None:
+            try:
+                soup = BeautifulSoup(html, "lxml", parse_only=strainer)
+            except Exception:
+                soup = BeautifulSoup(html, "lxml")
+        else:
+            soup = BeautifulSoup(html, "lxml")
+
         # Remove script and style elements
         for script in soup(["script", "style", "nav", "footer", "header"]):
             script.decompose()
-        
-        # Check if this pharmacy uses ONLY text extraction (skip selectors)
-        use_text_extraction_only = pharmacy_info.get("use_text_extraction", False)
-        
-        if use_text_extraction_only:
-            print(f"    [TEXT] Using text extraction only for {pharmacy_info['name']} (Angular/React app)")
-            # Obtener query del contexto si está disponible
-            query = pharmacy_info.get("_current_query", "")
-            products = extract_products_from_text(soup.get_text(), base_url, pharmacy_info, query=query)
-            return products
-        
+
         # Use pharmacy-specific product selectors
-        product_selectors = pharmacy_info.get("product_selectors", [
+        default_product_selectors = [
             ".product-item", ".product", ".item", ".producto",
             "[class*='product']", "[class*='item']", "[class*='resultado']"
-        ])
-        
-        product_containers = []
-        for selector in product_selectors:
-            containers = soup.select(selector)
-            if containers:
-                product_containers.extend(containers)
-                print(f"    Found {len(containers)} containers with selector: {selector}")
-        # De-dup containers by id/memory
-        try:
-            seen_ids = set()
-            uniq = []
-            for c in product_containers:
-                cid = id(c)
-                if cid in seen_ids: 
-                    continue
-                seen_ids.add(cid)
-                uniq.append(c)
-            product_containers = uniq
-        except Exception:
-            pass
-        
+        ]
+
+        # Selector único precompilado: un solo recorrido del DOM y sin
+        # duplicados entre selectores solapados
+        joined = _joined_selector(pharmacy_info, "product_selectors", default_product_selectors)
+        if joined is not None:
+            product_containers = joined.select(soup)
+            if product_containers:
+                print(f"    Found {len(product_containers)} containers with joined selector")
+        else:
+            product_containers = []
+            for selector in pharmacy_info.get("product_selectors", default_product_selectors):
+                containers = soup.select(selector)
+                if containers:
+                    product_containers.extend(containers)
+                    print(f"    Found {len(containers)} containers with selector: {selector}")
+            # De-dup containers by id/memory
+            try:
+                seen_ids = set()
+                uniq = []
+                for c in product_containers:
+                    cid = id(c)
+                    if cid in seen_ids:
+                        continue
+                    seen_ids.add(cid)
+                    uniq.append(c)
+                product_containers = uniq
+            except Exception:
+                pass
+
         # If no specific product containers found, look for price elements
         if not product_containers:
             # Look for any element containing a price
             price_elements = []
-            price_selectors = pharmacy_info.get("price_selectors", [".price", ".precio"])
-            for selector in price_selectors:
-                try:
-                    elements = soup.select(selector)
-                    if elements:
-                        price_elements.extend(elements)
-                        print(f"    Found {len(elements)} price elements with selector: {selector}")
-                except Exception as sel_error:
-                    print(f"    [WARN] Error with selector {selector}: {sel_error}")
-                    continue
-            
+            joined_price = _joined_selector(pharmacy_info, "price_selectors", [".price", ".precio"])
+            if joined_price is not None:
+                price_elements = joined_price.select(soup)
+                if price_elements:
+                    print(f"    Found {len(price_elements)} price elements with joined selector")
+            else:
+                for selector in pharmacy_info.get("price_selectors", [".price", ".precio"]):
+                    try:
+                        elements = soup.select(selector)
+                        if elements:
+                            price_elements.extend(elements)
+                            print(f"    Found {len(elements)} price elements with selector: {selector}")
+                    except Exception as sel_error:
+                        print(f"    [WARN] Error with selector {selector}: {sel_error}")
+                        continue
+
             if price_elements:
                 # Remove duplicates by text content
                 seen_prices = set()
@@ -955,7 +1846,8 @@ def extract_multiple_products(html: str, base_url: str, pharmacy_info: dict) ->
         if len(products) < 3:
             print(f"    [TEXT] Only {len(products)} products found with selectors, trying text extraction to find more...")
             query = pharmacy_info.get("_current_query", "")
-            text_products = extract_products_from_text(soup.get_text(), base_url, pharmacy_info, query=query)
+            # Texto desde el HTML original: el soup puede estar recortado
+            text_products = extract_products_from_text(html_to_text(html), base_url, pharmacy_info, query=query)
             # Combinar productos, evitando duplicados
             seen_keys = {(p.get("name", "").upper()[:50], p.get("price")) for p in products}
             for tp in text_products:
@@ -968,7 +1860,7 @@ def extract_multiple_products(html: str, base_url: str, pharmacy_info: dict) ->
         if not products:
             print(f"    [TEXT] No products found with selectors, trying text extraction...")
             query = pharmacy_info.get("_current_query", "")
-            products = extract_products_from_text(soup.get_text(), base_url, pharmacy_info, query=query)
+            products = extract_products_from_text(html_to_text(html), base_url, pharmacy_info, query=query)
         
         return products
     except Exception as e:
@@ -994,7 +1886,7 @@ def extract_single_product_from_element(price_elem, base_url: str) -> dict:
                     text = text.strip()
                     if len(text) > 5 and len(text) < 150 and text != price_text and not text.isdigit():
                         # Skip common non-product text
-                        if not any(skip in text.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible']):
+                        if not has_skip_word(text, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible')):
                             product_name = text
                             break
                 
@@ -1003,7 +1895,7 @@ def extract_single_product_from_element(price_elem, base_url: str) -> dict:
                     for tag in parent.find_all(['a', 'h1', 'h2', 'h3', 'h4', 'span', 'div']):
                         tag_text = tag.get_text().strip()
                         if len(tag_text) > 5 and len(tag_text) < 150 and tag_text != price_text:
-                            if not any(skip in tag_text.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible']):
+                            if not has_skip_word(tag_text, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible')):
                                 product_name = tag_text
                                 break
                 
@@ -1013,7 +1905,7 @@ def extract_single_product_from_element(price_elem, base_url: str) -> dict:
         
         # Clean up product name
         if product_name:
-            product_name = re.sub(r'\s+', ' ', product_name)  # Remove extra spaces
+            product_name = _collapse_ws(product_name)  # Remove extra spaces
             product_name = product_name.strip()
         
         return {
@@ -1028,114 +1920,150 @@ def extract_products_from_text(text: str, base_url: str, pharmacy_info: dict, qu
     """Extract products from text patterns when selectors fail"""
     products = []
     try:
-        import re
-        
         print(f"    [TEXT] Analyzing text for {pharmacy_info['name']}...")
         print(f"    [TEXT] Text length: {len(text)} characters")
         
-        # Look for price patterns in the text
-        price_patterns = [
-            r"S/\.?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)",
-            r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*S/\.?",
-            r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*soles?",
-            r"PEN\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)",
-            r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*PEN"
-        ]
-        
         found_prices = []
-        for pattern in price_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches:
-                if isinstance(match, tuple):
-                    match = match[0]
-                try:
-                    price_num = float(match.replace(",", "."))
+        data = text.encode("utf-8", "ignore")
+        spans = scan_price_spans(data)
+        if spans is not None:
+            # Hyperscan como prefiltro: fusionar spans solapados (reporta cada
+            # fin de match posible) y validar cada región con RE_PRICE_ALL
+            spans.sort()
+            regions = []
+            for start, end in spans:
+                if regions and start <= regions[-1][1]:
+                    regions[-1][1] = max(regions[-1][1], end)
+                else:
+                    regions.append([start, end])
+            for start, end in regions:
+                chunk = data[start:end].decode("utf-8", "ignore")
+                for m in RE_PRICE_ALL.finditer(chunk):
+                    if not (m.group("cur") or m.group("cur2")):
+                        continue
+                    try:
+                        price_num = float(m.group("num").replace(",", "."))
+                    except ValueError:
+                        continue
                     if 0.01 <= price_num <= 10000:  # Reasonable price range
-                        price_str = f"S/ {match}"
+                        price_str = f"S/ {m.group('num')}"
                         if price_str not in found_prices:
                             found_prices.append(price_str)
+        else:
+            # Una sola pasada con la alternación fusionada en lugar de un
+            # escaneo por patrón: cada byte del texto se toca una vez
+            for m in RE_PRICE_ALL.finditer(text):
+                if not (m.group("cur") or m.group("cur2")):
+                    continue
+                match = m.group("num")
+                try:
+                    price_num = float(match.replace(",", "."))
                 except ValueError:
                     continue
+                if 0.01 <= price_num <= 10000:  # Reasonable price range
+                    price_str = f"S/ {match}"
+                    if price_str not in found_prices:
+                        found_prices.append(price_str)
         
         print(f"    [TEXT] Found {len(found_prices)} unique prices")
         
         # Buscar nombres de productos cerca de los precios
-        lines = text.split('\n')
+        # (splitlines: loop C más rápido que split('\n') y maneja \r\n)
+        lines = text.splitlines()
         query_lower = query.lower() if query else ""
-        
-        # Buscar líneas que contengan el query y un precio cerca
-        for i, line in enumerate(lines):
-            line_lower = line.lower()
-            # Buscar si la línea contiene el query o un precio
-            has_query = query_lower and query_lower in line_lower
-            has_price = any(price.replace("S/ ", "").replace(".", "").replace(",", "") in line.replace("S/", "").replace(".", "").replace(",", "") for price in found_prices)
-            
-            if has_price or has_query:
-                # Buscar precio en esta línea o líneas cercanas
-                price_found = None
-                for price in found_prices:
-                    price_clean = price.replace("S/ ", "").replace(".", "").replace(",", "")
-                    line_clean = line.replace("S/", "").replace(".", "").replace(",", "")
-                    if price_clean in line_clean:
-                        price_found = price
+
+        # Precalcular una sola vez el precio presente en cada línea:
+        # dict de token-limpio -> precio + un escaneo de tokens numéricos por
+        # línea, en vez de re-normalizar cada precio contra cada línea (O(L·P))
+        cleaned_prices = {p.replace("S/ ", "").replace(".", "").replace(",", ""): p
+                          for p in found_prices}
+
+        # Inicios de línea, alineados con splitlines(): para mapear offsets
+        # de tokens y del query a índices de línea vía bisect
+        line_starts = []
+        acc = 0
+        for raw_line in text.splitlines(keepends=True):
+            line_starts.append(acc)
+            acc += len(raw_line)
+
+        # Un único escaneo C de tokens numéricos sobre el texto completo en
+        # vez de un findall por línea: el loop Python corre solo por match
+        line_prices = [None] * len(lines)
+        if cleaned_prices:
+            for m in RE_NUM_TOKEN.finditer(text):
+                idx = bisect.bisect_right(line_starts, m.start()) - 1
+                if 0 <= idx < len(line_prices) and line_prices[idx] is None:
+                    p = cleaned_prices.get(m.group().replace(".", "").replace(",", ""))
+                    if p:
+                        line_prices[idx] = p
+
+        # Solo las líneas candidatas (con precio o con el query) entran al
+        # loop de nombres: en páginas grandes son una fracción mínima del
+        # total. Las ocurrencias del query se ubican por offset + bisect
+        # sobre los inicios de línea en vez de escanear línea por línea
+        candidate_idxs = {i for i, p in enumerate(line_prices) if p}
+        if query_lower:
+            text_lower = text.lower()
+            pos = text_lower.find(query_lower)
+            while pos != -1:
+                candidate_idxs.add(bisect.bisect_right(line_starts, pos) - 1)
+                pos = text_lower.find(query_lower, pos + 1)
+
+        seen_keys = set()
+        for i in sorted(candidate_idxs):
+            line = lines[i]
+            price_found = line_prices[i]
+
+            # Si no hay precio en esta línea, buscar en líneas cercanas
+            if not price_found:
+                for j in range(max(0, i-2), min(len(lines), i+3)):
+                    if line_prices[j]:
+                        price_found = line_prices[j]
                         break
-                
-                # Si no hay precio en esta línea, buscar en líneas cercanas
-                if not price_found:
-                    for j in range(max(0, i-2), min(len(lines), i+3)):
-                        nearby_line = lines[j]
-                        for price in found_prices:
-                            price_clean = price.replace("S/ ", "").replace(".", "").replace(",", "")
-                            nearby_clean = nearby_line.replace("S/", "").replace(".", "").replace(",", "")
-                            if price_clean in nearby_clean:
-                                price_found = price
-                                break
-                        if price_found:
-                            break
-                
-                if price_found:
-                    # Buscar nombre del producto
-                    product_name = ""
+
+            if price_found:
+                # Buscar nombre del producto
+                product_name = ""
                     
-                    # Primero intentar en la misma línea
-                    line_clean = re.sub(r"S/\.?\s*\d+[.,]?\d*", "", line).strip()
-                    if len(line_clean) > 5 and len(line_clean) < 150:
-                        if not any(skip in line_clean.lower() for skip in 
-                                 ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'precio', 'soles', 'click', 'button', 'cantidad', 'añadir']):
-                            product_name = line_clean
+                # Primero intentar en la misma línea
+                line_clean = RE_PRICE_STRIP.sub("", line).strip()
+                if len(line_clean) > 5 and len(line_clean) < 150:
+                    if not has_skip_word(line_clean, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'precio', 'soles', 'click', 'button', 'cantidad', 'añadir')):
+                        product_name = line_clean
                     
-                    # Si no, buscar en líneas cercanas
-                    if not product_name:
-                        for j in range(max(0, i-3), min(len(lines), i+4)):
-                            nearby_line = lines[j].strip()
-                            nearby_clean = re.sub(r"S/\.?\s*\d+[.,]?\d*", "", nearby_line).strip()
-                            if (len(nearby_clean) > 8 and len(nearby_clean) < 150 and 
-                                not nearby_clean.isdigit() and
-                                not any(skip in nearby_clean.lower() for skip in 
-                                       ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'precio', 'soles', 'click', 'button', 'cantidad', 'añadir', 'carrito'])):
-                                # Preferir líneas que contengan el query
-                                if query_lower and query_lower in nearby_clean.lower():
-                                    product_name = nearby_clean
-                                    break
-                                elif not product_name:
-                                    product_name = nearby_clean
+                # Si no, buscar en líneas cercanas
+                if not product_name:
+                    for j in range(max(0, i-3), min(len(lines), i+4)):
+                        nearby_line = lines[j].strip()
+                        nearby_clean = RE_PRICE_STRIP.sub("", nearby_line).strip()
+                        if (len(nearby_clean) > 8 and len(nearby_clean) < 150 and 
+                            not nearby_clean.isdigit() and
+                            not has_skip_word(nearby_clean, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'precio', 'soles', 'click', 'button', 'cantidad', 'añadir', 'carrito'))):
+                            # Preferir líneas que contengan el query
+                            if query_lower and query_lower in nearby_clean.lower():
+                                product_name = nearby_clean
+                                break
+                            elif not product_name:
+                                product_name = nearby_clean
                     
-                    # Si aún no hay nombre, usar el query
-                    if not product_name and query:
-                        product_name = query.upper()
+                # Si aún no hay nombre, usar el query
+                if not product_name and query:
+                    product_name = query.upper()
                     
-                    if product_name and price_found:
-                        # Evitar duplicados
-                        combo_key = (product_name[:50].upper(), price_found)
-                        if not any(p.get("name", "").upper() == product_name.upper() and p.get("price") == price_found for p in products):
-                            products.append({
-                                "name": product_name,
-                                "price": price_found,
-                                "url": base_url
-                            })
-                            print(f"    [TEXT] OK Extracted: {product_name[:50]} - {price_found}")
-                            if len(products) >= 50:  # Aumentado el límite
-                                break
+                if product_name and price_found:
+                    # Evitar duplicados: set de claves canónicas en vez de
+                    # escanear la lista entera por candidato
+                    combo_key = (product_name[:50].upper(), price_found)
+                    if combo_key not in seen_keys:
+                        seen_keys.add(combo_key)
+                        products.append({
+                            "name": product_name,
+                            "price": price_found,
+                            "url": base_url
+                        })
+                        print(f"    [TEXT] OK Extracted: {product_name[:50]} - {price_found}")
+                        if len(products) >= 50:  # Aumentado el límite
+                            break
         
         # Si aún no hay productos, crear con precios encontrados
         if not products and found_prices:
@@ -1159,6 +2087,20 @@ def extract_products_from_text(text: str, base_url: str, pharmacy_info: dict, qu
         print(traceback.format_exc())
         return products
 
+@lru_cache(maxsize=256)
+def _compiled_sel(selector: str):
+    """Selector individual precompilado con soupsieve (cache global): evita
+    re-parsear el string CSS en cada contenedor del loop de nombres."""
+    import soupsieve
+    return soupsieve.compile(selector)
+
+def _select_cached(container, selector: str, limit: int = 0):
+    """container.select(selector) con selector precompilado."""
+    try:
+        return _compiled_sel(selector).select(container, limit=limit)
+    except Exception:
+        return container.select(selector)
+
 def extract_single_product_from_container(container, base_url: str, pharmacy_info: dict = None) -> dict:
     """Extract product info from a product container"""
     try:
@@ -1168,7 +2110,8 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
         price_elem = None
         price_selectors = pharmacy_info.get("price_selectors", [".price", ".precio", "[class*='price']", "[class*='precio']"]) if pharmacy_info else [".price", ".precio", "[class*='price']", "[class*='precio']"]
         for selector in price_selectors:
-            price_elem = container.select_one(selector)
+            found = _select_cached(container, selector, limit=1)
+            price_elem = found[0] if found else None
             if price_elem:
                 price_text_raw = price_elem.get_text().strip()
                 price = normalize_price(price_text_raw)
@@ -1183,16 +2126,18 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
         product_name = ""
         pharmacy_name = pharmacy_info.get("name", "") if pharmacy_info else ""
         
-        # 1. Buscar en headings primero (h1-h6)
+        # 1. Buscar en headings primero (h1-h6): una sola pasada por el árbol
+        # y luego iterar por nivel para mantener la prioridad h1 > h2 > ...
+        all_headings = container.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
         for tag_name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
-            headings = container.select(tag_name)
+            headings = [h for h in all_headings if h.name == tag_name]
             for heading in headings:
                 heading_text = heading.get_text().strip()
                 # Excluir si es el precio o contiene solo números/precio
                 if (len(heading_text) > 5 and len(heading_text) < 150 and 
                     heading_text != price_text_raw and 
                     not heading_text.startswith("S/") and
-                    not any(skip in heading_text.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio'])):
+                    not has_skip_word(heading_text, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio'))):
                     product_name = heading_text
                     break
             if product_name:
@@ -1230,7 +2175,8 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
             for selector in name_selectors:
                 try:
                     # Buscar TODOS los elementos que coincidan, no solo el primero
-                    name_elems = container.select(selector)
+                    # (selector precompilado: este loop corre por cada contenedor)
+                    name_elems = _select_cached(container, selector)
                     for name_elem in name_elems:
                         # Verificar que no sea el elemento del precio
                         if name_elem == price_elem:
@@ -1246,7 +2192,7 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
                             not name_text.startswith("S/") and
                             price_text_raw not in name_text and
                             not re.match(r'^[\d\s.,]+$', name_text) and  # No solo números
-                            not any(skip in name_text.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir'])):
+                            not has_skip_word(name_text, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir'))):
                             product_name = name_text
                             break
                     if product_name:
@@ -1257,7 +2203,8 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
         # 3. Buscar en links de manera más agresiva - MEJORADO
         if not product_name:
             try:
-                links = container.select("a[href]")
+                # find_all evita la compilación CSS de select("a[href]")
+                links = container.find_all("a", href=True)
                 for link in links:
                     # Verificar que el link no sea el precio
                     if link == price_elem or (price_elem and price_elem in link.descendants):
@@ -1271,7 +2218,7 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
                             not t.startswith("S/") and
                             price_text_raw not in t and
                             not re.match(r'^[\d\s.,]+$', t) and
-                            not any(w in t.lower() for w in ['agregar','comprar','carrito','precio','soles','ver más'])):
+                            not has_skip_word(t, ('agregar','comprar','carrito','precio','soles','ver más'))):
                             product_name = t
                             break
                     if product_name:
@@ -1284,7 +2231,7 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
                         not link_text.startswith("S/") and
                         price_text_raw not in link_text and
                         not re.match(r'^[\d\s.,]+$', link_text) and
-                        not any(skip in link_text.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'click', 'button'])):
+                        not has_skip_word(link_text, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'click', 'button'))):
                         product_name = link_text
                         break
             except Exception:
@@ -1311,14 +2258,14 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
             container_text_before_price = re.sub(r'\d+[.,]\d+\s*soles?', '', container_text_before_price, flags=re.IGNORECASE)
             
             # Dividir en líneas y buscar la mejor
-            lines_before_price = [line.strip() for line in container_text_before_price.split('\n') if line.strip()]
+            lines_before_price = [line.strip() for line in container_text_before_price.splitlines() if line.strip()]
             
             # Priorizar líneas que parezcan nombres de productos
             for line in lines_before_price:
                 if (len(line) > 8 and len(line) < 200 and
                     not line.startswith("S/") and
                     not re.match(r'^[\d\s.,]+$', line) and
-                    not any(skip in line.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button', 'seleccionar', 'opciones', 'leer más'])):
+                    not has_skip_word(line, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button', 'seleccionar', 'opciones', 'leer más'))):
                     # Si la línea tiene características de nombre de producto, usarla
                     has_letters = bool(re.search(r'[A-Za-zÁÉÍÓÚáéíóú]', line))
                     has_reasonable_length = 10 <= len(line) <= 150
@@ -1347,7 +2294,7 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
                 
                 for elem, tag_text in all_elements:
                     if (not re.match(r'^[\d\s.,]+$', tag_text) and
-                        not any(skip in tag_text.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button'])):
+                        not has_skip_word(tag_text, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button'))):
                         
                         score = 0
                         if elem and elem.name in ['h1', 'h2', 'h3', 'h4', 'h5', 'h6']:
@@ -1385,7 +2332,7 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
                     not elem_text.startswith("S/") and
                     price_text_raw not in elem_text and
                     not re.match(r'^[\d\s.,]+$', elem_text) and
-                    not any(skip in elem_text.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button', 'seleccionar'])):
+                    not has_skip_word(elem_text, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button', 'seleccionar'))):
                     all_text_elements.append((elem, elem_text))
             
             # Si no encontramos nada, buscar en el texto plano del contenedor
@@ -1398,12 +2345,12 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
                     container_text = container_text.replace(price, "")
                 container_text = re.sub(r'S/\.?\s*\d+[.,]?\d*', '', container_text)
                 
-                lines = [line.strip() for line in container_text.split('\n') if line.strip()]
+                lines = [line.strip() for line in container_text.splitlines() if line.strip()]
                 for line in lines:
                     if (len(line) > 5 and len(line) < 200 and
                         not line.startswith("S/") and
                         not re.match(r'^[\d\s.,]+$', line) and
-                        not any(skip in line.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button'])):
+                        not has_skip_word(line, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button'))):
                         all_text_elements.append((None, line))
             
             # Evaluar y seleccionar el mejor candidato
@@ -1447,7 +2394,7 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
             container_text = re.sub(r'S/\.?\s*\d+[.,]?\d*', '', container_text)
             container_text = re.sub(r'\d+[.,]\d+\s*soles?', '', container_text, flags=re.IGNORECASE)
             
-            lines = [line.strip() for line in container_text.split('\n') if line.strip()]
+            lines = [line.strip() for line in container_text.splitlines() if line.strip()]
             
             # Evaluar todas las líneas y elegir la mejor
             candidates = []
@@ -1455,7 +2402,7 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
                 if (len(line) > 8 and len(line) < 200 and
                     not line.startswith("S/") and
                     not re.match(r'^[\d\s.,]+$', line) and
-                    not any(skip in line.lower() for skip in ['agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button', 'seleccionar', 'opciones'])):
+                    not has_skip_word(line, ('agregar', 'comprar', 'ver', 'más', 'menos', 'stock', 'disponible', 'carrito', 'precio', 'soles', 'cantidad', 'añadir', 'click', 'button', 'seleccionar', 'opciones'))):
                     # Calcular score
                     score = 0
                     if any(c.isupper() for c in line):  # Tiene mayúsculas
@@ -1477,7 +2424,7 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
         if product_name:
             # Remover cualquier patrón de precio que pueda haber quedado
             product_name = re.sub(r'S/\.?\s*\d+[.,]?\d*', '', product_name)
-            product_name = re.sub(r'\s+', ' ', product_name)  # Remove extra spaces
+            product_name = _collapse_ws(product_name)  # Remove extra spaces
             product_name = product_name.strip()
             # Asegurar que no sea solo el precio
             if product_name.startswith("S/") or re.match(r'^[\d\s.,]+$', product_name):
@@ -1504,7 +2451,7 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
         
         # Look for product URL
         product_url = base_url
-        link_elem = container.select_one("a[href]")
+        link_elem = container.find("a", href=True)
         if link_elem:
             href = link_elem.get("href")
             if href:
@@ -1525,20 +2472,82 @@ def extract_single_product_from_container(container, base_url: str, pharmacy_inf
         print(traceback.format_exc())
         return {}
 
+def _extract_product_info_lexbor(html: str, url: str) -> dict:
+    """Fast path de extract_product_info con selectolax (Lexbor): mismo
+    recorrido precio/título/headings pero sin construir objetos BS4."""
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(["script", "style", "nav", "footer", "header"])
+    root = tree.body or tree.root
+    text = root.text(separator="\n") if root is not None else ""
+
+    price = normalize_price(text)
+    if not price:
+        for selector in (".price", ".precio", ".cost", ".valor",
+                         "[class*='price']", "[class*='precio']", "[class*='cost']",
+                         "[id*='price']", "[id*='precio']", "[id*='cost']"):
+            for node in tree.css(selector):
+                price = normalize_price(node.text(strip=True))
+                if price:
+                    break
+            if price:
+                break
+
+    if not price:
+        return {}
+
+    product_name = ""
+    title = tree.css_first("title")
+    if title is not None:
+        product_name = title.text(strip=True)
+
+    if not product_name:
+        for node in tree.css("h1, h2, h3"):
+            text_content = node.text(strip=True)
+            if len(text_content) > 5 and len(text_content) < 100:
+                product_name = text_content
+                break
+
+    if not product_name:
+        for selector in (".product-name", ".product-title", ".item-name", ".producto-nombre",
+                         "[class*='product']", "[class*='item']", "[class*='nombre']"):
+            for node in tree.css(selector):
+                name_text = node.text(strip=True)
+                if len(name_text) > 5 and len(name_text) < 100:
+                    product_name = name_text
+                    break
+            if product_name:
+                break
+
+    if product_name:
+        product_name = _collapse_ws(product_name)
+        product_name = product_name[:100]  # Limit length
+
+    return {
+        "price": price,
+        "product_name": product_name,
+        "text": text[:500]  # First 500 chars for debugging
+    }
+
 def extract_product_info(html: str, url: str) -> dict:
     """Extract product information from HTML"""
+    if LexborHTMLParser is not None:
+        try:
+            return _extract_product_info_lexbor(html, url)
+        except Exception as e:
+            print(f"    [WARN] Lexbor parse failed, falling back to BS4: {e}")
+
     try:
         from bs4 import BeautifulSoup
     except ImportError:
         return {}
-    
+
     try:
         soup = BeautifulSoup(html, "lxml")
-        
+
         # Remove script and style elements
         for script in soup(["script", "style", "nav", "footer", "header"]):
             script.decompose()
-        
+
         text = soup.get_text()
         
         # Look for price in the text
@@ -1597,7 +2606,7 @@ def extract_product_info(html: str, url: str) -> dict:
         
         # Clean up product name
         if product_name:
-            product_name = re.sub(r'\s+', ' ', product_name)
+            product_name = _collapse_ws(product_name)
             product_name = product_name[:100]  # Limit length
         
         return {
@@ -1609,10 +2618,16 @@ def extract_product_info(html: str, url: str) -> dict:
         print(f"Error extracting product info: {e}")
         return {}
 
-def search_pharmacy_direct(query: str, pharmacy_info: dict, timeout=8) -> list:
-    """Search directly on a pharmacy website using specific search URL"""
+def search_pharmacy_direct(query: str, pharmacy_info: dict, timeout=8, stop=None) -> list:
+    """Search directly on a pharmacy website using specific search URL
+
+    `stop` (threading.Event opcional): cancelación cooperativa — cuando el
+    colector ya juntó max_sites resultados, los workers en vuelo abandonan
+    en el siguiente checkpoint en vez de seguir quemando red/CPU."""
     results = []
     try:
+        if stop is not None and stop.is_set():
+            return results
         # Manejar URLs especiales que requieren formato diferente
         search_url_template = pharmacy_info["search_url"]
         if pharmacy_info.get("custom_search_url", False):
@@ -1636,7 +2651,10 @@ def search_pharmacy_direct(query: str, pharmacy_info: dict, timeout=8) -> list:
         pharmacy_info["_current_query"] = query
         
         try:
-            r = requests.get(search_url, headers=HDRS, timeout=timeout)
+            # Session compartida: reutiliza socket TCP y sesión TLS entre la
+            # búsqueda y los follow-ups al mismo host; polite_get añade el
+            # límite por host y el backoff ante throttling
+            r = polite_get(search_url, timeout=timeout)
         except requests.exceptions.Timeout:
             print(f"    [ERROR] {pharmacy_info['name']}: Timeout")
             return results
@@ -1648,39 +2666,24 @@ def search_pharmacy_direct(query: str, pharmacy_info: dict, timeout=8) -> list:
             return results
         
         if r.status_code == 200:
+            if stop is not None and stop.is_set():
+                return results
             # Sitios con JS: intentar renderizar con Selenium si está configurado
             use_selenium = pharmacy_info.get("use_selenium", False) or pharmacy_info.get("use_text_extraction", False)
             if use_selenium:
                 rendered_html = ""
                 rendered_text = ""
                 try:
-                    from selenium import webdriver
-                    from selenium.webdriver.chrome.options import Options
                     from selenium.webdriver.common.by import By
                     from selenium.webdriver.support.ui import WebDriverWait
                     from selenium.webdriver.support import expected_conditions as EC
-                    # Driver manager para asegurar ChromeDriver disponible
-                    try:
-                        from selenium.webdriver.chrome.service import Service
-                        from webdriver_manager.chrome import ChromeDriverManager
-                        _service = Service(ChromeDriverManager().install())
-                    except Exception:
-                        _service = None
-
-                    chrome_options = Options()
-                    chrome_options.add_argument("--headless=new")
-                    chrome_options.add_argument("--no-sandbox")
-                    chrome_options.add_argument("--disable-dev-shm-usage")
-                    chrome_options.add_argument("--disable-gpu")
-                    chrome_options.add_argument("--window-size=1366,768")
-                    chrome_options.add_argument(f"--user-agent={UA}")
-                    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-                    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"]) 
-                    chrome_options.add_experimental_option('useAutomationExtension', False)
 
                     driver = None
+                    # El driver compartido no es thread-safe: el lock
+                    # serializa las búsquedas que rendericen con Selenium
+                    _DRIVER_LOCK.acquire()
                     try:
-                        driver = webdriver.Chrome(service=_service, options=chrome_options) if _service else webdriver.Chrome(options=chrome_options)
+                        driver = _get_driver()
                         driver.get(search_url)
                         # Esperar contenido dinámico razonable
                         try:
@@ -1730,14 +2733,21 @@ def search_pharmacy_direct(query: str, pharmacy_info: dict, timeout=8) -> list:
                                         pass
                         except Exception:
                             pass
-                        # Espera adicional a que aparezca patrón de precio en el HTML
-                        tries = 0
-                        while tries < 5:
-                            html_tmp = driver.page_source or ""
-                            if ("S/" in html_tmp) or (query.lower() in html_tmp.lower()):
-                                break
-                            _t.sleep(1.0)
-                            tries += 1
+                        # Espera adicional a que aparezca patrón de precio,
+                        # con un probe JS liviano dentro del browser:
+                        # page_source re-serializa el DOM completo y lo manda
+                        # entero por el wire en cada intento
+                        try:
+                            _probe = (
+                                "var t=(document.body&&document.body.innerText)||'';"
+                                "t=t.toLowerCase();"
+                                "return t.indexOf('s/')!==-1||t.indexOf(%s)!==-1;"
+                            ) % json.dumps(query.lower())
+                            WebDriverWait(driver, 5, poll_frequency=0.5).until(
+                                lambda d: d.execute_script(_probe)
+                            )
+                        except Exception:
+                            pass
                         rendered_html = driver.page_source or ""
                         # Extraer texto renderizado del body (mejor para buscar por regex)
                         def _capture_body_text():
@@ -1760,13 +2770,14 @@ def search_pharmacy_direct(query: str, pharmacy_info: dict, timeout=8) -> list:
                     finally:
                         if driver:
                             try:
-                                driver.quit()
+                                # No cerrar Chrome: limpiar estado y dejarlo
+                                # listo para la próxima búsqueda
+                                driver.delete_all_cookies()
+                                driver.get("about:blank")
                             except Exception as qe:
-                                print(f"    [WARN] Error closing driver: {qe}")
-                                try:
-                                    driver.close()
-                                except:
-                                    pass
+                                print(f"    [WARN] Error resetting driver: {qe}")
+                                _shutdown_driver()
+                        _DRIVER_LOCK.release()
                 except Exception as se:
                     print(f"    [WARN] Selenium no disponible/funcionó: {se}")
                     rendered_html = ""
@@ -1797,13 +2808,7 @@ def search_pharmacy_direct(query: str, pharmacy_info: dict, timeout=8) -> list:
                 # (ahora más agresivo: siempre intentar si hay menos de 3 productos)
                 if len(products) < 3:
                     print(f"    [TEXT] Only {len(products)} products found with selectors, trying text extraction as fallback...")
-                    try:
-                        from bs4 import BeautifulSoup
-                        soup_fallback = BeautifulSoup(r.text, "lxml")
-                        text_fallback = soup_fallback.get_text()
-                    except Exception:
-                        text_fallback = r.text
-                    text_products = extract_products_from_text(text_fallback, search_url, pharmacy_info, query=query)
+                    text_products = extract_products_from_text(html_to_text(r.text), search_url, pharmacy_info, query=query)
                     # Combinar productos, evitando duplicados
                     if text_products:
                         seen_keys = {(p.get("name", "").upper()[:50], p.get("price")) for p in products}
@@ -1815,6 +2820,8 @@ def search_pharmacy_direct(query: str, pharmacy_info: dict, timeout=8) -> list:
             # Procesar productos encontrados (tanto con JS como sin JS)
             print(f"    [DEBUG] {pharmacy_info['name']}: Found {len(products)} products before processing")
             for idx, product in enumerate(products):
+                if stop is not None and stop.is_set():
+                    break
                 try:
                     # Debug: imprimir información del producto
                     product_price = product.get("price") if product and isinstance(product, dict) else None
@@ -1852,15 +2859,54 @@ def search_pharmacy_direct(query: str, pharmacy_info: dict, timeout=8) -> list:
     
     return results
 
+# Índice en memoria de claves (producto, precio, farmacia) ya presentes en el
+# cache Parquet: filtrar contra el set es O(|nuevas|) y evita el
+# concat + drop_duplicates sobre todo lo acumulado en cada búsqueda
+_WEB_CACHE_KEYS = None
+_WEB_CACHE_LOCK = threading.Lock()
+
+def _web_cache_dataset():
+    """Directorio del dataset Parquet; migra el archivo único de versiones previas"""
+    if not os.path.isdir(WEB_CACHE_DIR):
+        os.makedirs(WEB_CACHE_DIR, exist_ok=True)
+        if os.path.isfile(WEB_CACHE_PARQUET):
+            try:
+                shutil.move(WEB_CACHE_PARQUET, os.path.join(WEB_CACHE_DIR, "part-00000.parquet"))
+            except Exception as e:
+                print(f"[WARN] Could not migrate web cache file: {e}")
+    return WEB_CACHE_DIR
+
+def _web_cache_nonempty():
+    try:
+        if os.path.isfile(WEB_CACHE_PARQUET):
+            return True
+        return os.path.isdir(WEB_CACHE_DIR) and any(
+            f.endswith(".parquet") for f in os.listdir(WEB_CACHE_DIR))
+    except OSError:
+        return False
+
+def _web_cache_keys():
+    """Set de claves hashadas ya guardadas; se construye una vez por proceso"""
+    global _WEB_CACHE_KEYS
+    if _WEB_CACHE_KEYS is None:
+        keys = set()
+        if _web_cache_nonempty():
+            try:
+                cols = ["Producto (Marca comercial)", "Precio", "Farmacia / Fuente"]
+                df = pd.read_parquet(_web_cache_dataset(), columns=cols)
+                for prod, price, farm in df.itertuples(index=False, name=None):
+                    keys.add(_dedup_key(prod, price, farm))
+            except Exception as e:
+                print(f"[WARN] Could not index web cache: {e}")
+        _WEB_CACHE_KEYS = keys
+    return _WEB_CACHE_KEYS
+
 def save_web_results_to_csv(web_results: list):
-    """Save web scraping results to the main CSV for faster future searches"""
+    """Save web scraping results to the Parquet cache for faster future searches"""
     if not web_results:
         return
     
     try:
-        # Load current main CSV
-        df_main = load_normalized(EXCEL_PATH, "main")
-        
         # Convert web results to DataFrame format
         new_rows = []
         for result in web_results:
@@ -1881,36 +2927,102 @@ def save_web_results_to_csv(web_results: list):
             }
             new_rows.append(new_row)
         
-        # Add new rows to main DataFrame
+        # Append al cache Parquet: solo las filas realmente nuevas (filtradas
+        # contra el índice de claves) van a un part-file propio — ni se relee
+        # ni se reescribe lo acumulado
         if new_rows:
             try:
-                df_new = pd.DataFrame(new_rows)
-                df_main = pd.concat([df_main, df_new], ignore_index=True)
-                
-                # Remove duplicates based on product name, price, and pharmacy
-                df_main = df_main.drop_duplicates(
-                    subset=["Producto (Marca comercial)", "Precio", "Farmacia / Fuente"], 
-                    keep="first"
-                )
-                
-                # Save back to CSV
-                df_main.to_excel(EXCEL_PATH, index=False, engine='openpyxl')
-                print(f"[CACHE] Saved {len(new_rows)} web results to main CSV")
+                with _WEB_CACHE_LOCK:
+                    keys = _web_cache_keys()
+                    fresh = []
+                    for row in new_rows:
+                        k = _dedup_key(row["Producto (Marca comercial)"],
+                                       row["Precio"], row["Farmacia / Fuente"])
+                        if k not in keys:
+                            keys.add(k)
+                            fresh.append(row)
+                    if fresh:
+                        part = os.path.join(
+                            _web_cache_dataset(),
+                            f"part-{int(time.time() * 1000)}-{os.getpid()}.parquet")
+                        pd.DataFrame(fresh).to_parquet(part, compression="zstd")
+                        print(f"[CACHE] Appended {len(fresh)} new web results to Parquet cache")
+                    else:
+                        print("[CACHE] No new web results to append")
             except Exception as save_ex:
-                print(f"[WARN] Error in DataFrame operations: {save_ex}")
-                # Intentar guardar solo los nuevos resultados si falla la concatenación
-                try:
-                    df_new_only = pd.DataFrame(new_rows)
-                    df_new_only.to_excel(EXCEL_PATH, index=False, engine='openpyxl')
-                    print(f"[CACHE] Saved {len(new_rows)} new results (replaced file)")
-                except Exception as save_ex2:
-                    print(f"[WARN] Could not save results: {save_ex2}")
+                print(f"[WARN] Could not save web cache: {save_ex}")
     
     except Exception as e:
         print(f"[WARN] Error saving web results to CSV: {e}")
         import traceback
         print(traceback.format_exc())
 
+# Claves de dedup como enteros de 64 bits: hashear una vez es más barato que
+# comparar tuplas de strings largos (URLs) en cada lookup del set
+try:
+    import xxhash
+    def _dedup_key(*parts) -> int:
+        return xxhash.xxh3_64_intdigest("|".join(str(p) for p in parts).encode("utf-8", "ignore"))
+except ImportError:
+    def _dedup_key(*parts) -> int:
+        return hash(parts)
+
+# --- Cache persistente de scrapes por (query, farmacia) ---
+_QCACHE_LOCK = threading.Lock()
+_QCACHE_CONN = None
+
+def _qcache_conn():
+    """Conexión sqlite compartida (WAL) para el cache de queries web"""
+    global _QCACHE_CONN
+    if _QCACHE_CONN is None:
+        conn = sqlite3.connect(WEB_QUERY_CACHE_DB, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache("
+            "query TEXT, pharmacy TEXT, fetched_at INTEGER, payload BLOB, "
+            "PRIMARY KEY(query, pharmacy))"
+        )
+        conn.commit()
+        _QCACHE_CONN = conn
+    return _QCACHE_CONN
+
+def _qcache_norm(q: str) -> str:
+    # Normalizar para subir el hit-rate: mayúsculas, sin espacios extremos
+    # y forma NFKD (tildes/ligaduras equivalentes)
+    return unicodedata.normalize("NFKD", (q or "").upper().strip())
+
+def search_pharmacy_cached(query: str, pharmacy_info: dict, timeout=8, stop=None) -> list:
+    """search_pharmacy_direct con cache sqlite: queries repetidas dentro del
+    TTL devuelven los resultados guardados sin volver a raspar la web"""
+    qn = _qcache_norm(query)
+    name = pharmacy_info.get("name", "")
+    now = int(time.time())
+    try:
+        with _QCACHE_LOCK:
+            row = _qcache_conn().execute(
+                "SELECT payload FROM cache WHERE query=? AND pharmacy=? AND fetched_at>?",
+                (qn, name, now - WEB_QUERY_CACHE_TTL)).fetchone()
+        if row:
+            print(f"    [CACHE] {name}: cached results for '{query}'")
+            return pickle.loads(row[0])
+    except Exception as e:
+        print(f"[WARN] Query cache read failed: {e}")
+    if stop is not None and stop.is_set():
+        return []
+    results = search_pharmacy_direct(query, pharmacy_info, timeout=timeout, stop=stop)
+    # Solo se cachean aciertos completos: un scrape fallido o cancelado a
+    # mitad (stop seteado al llenarse el presupuesto) no debe fijarse por horas
+    if results and not (stop is not None and stop.is_set()):
+        try:
+            with _QCACHE_LOCK:
+                conn = _qcache_conn()
+                conn.execute("INSERT OR REPLACE INTO cache VALUES (?,?,?,?)",
+                             (qn, name, now, pickle.dumps(results)))
+                conn.commit()
+        except Exception as e:
+            print(f"[WARN] Query cache write failed: {e}")
+    return results
+
 def fetch_prices_online(query: str, selected_pharmacies: list = None, max_sites: int = 30, timeout=8):
     """Enhanced web scraping for Peruvian pharmacies - Comprehensive version"""
     print(f"[INFO] Searching for: {query}")
@@ -1927,64 +3039,115 @@ def fetch_prices_online(query: str, selected_pharmacies: list = None, max_sites:
         pharmacies_to_search = PERUVIAN_PHARMACIES
     
     # 1. Search directly on selected Peruvian pharmacy websites
+    # En paralelo: el trabajo es I/O-bound (HTTP + Selenium) y el tiempo total
+    # pasa a ser ~max por farmacia en vez de la suma. Los resultados se
+    # procesan en el orden de la lista para mantener la salida determinista
     print("[INFO] Searching Peruvian pharmacies directly...")
-    for i, pharmacy_info in enumerate(pharmacies_to_search, 1):
-        print(f"  [{i}/{len(pharmacies_to_search)}] Searching {pharmacy_info['name']}...")
-        try:
-            results = search_pharmacy_direct(query, pharmacy_info, timeout=timeout)
-            print(f"    [DEBUG] {pharmacy_info['name']}: search_pharmacy_direct returned {len(results)} results")
-            for idx, result in enumerate(results):
-                try:
-                    precio = result.get("Precio", "")
-                    producto = result.get("Producto (Marca comercial)", "")
-                    farmacia = result.get("Farmacia / Fuente", "")
-                    enlace = result.get("Enlace", "")
-                    key = (farmacia, precio, enlace)
+    from concurrent.futures import ThreadPoolExecutor
+    executor = ThreadPoolExecutor(max_workers=min(16, max(1, len(pharmacies_to_search))))
+    stop = threading.Event()  # cancelación cooperativa al llenar max_sites
+    futures = [(pharmacy_info, executor.submit(search_pharmacy_cached, query, pharmacy_info,
+                                               timeout=timeout, stop=stop))
+               for pharmacy_info in pharmacies_to_search]
+    # DDG se lanza en paralelo con la etapa 1 (como el resto del fan-out):
+    # si hace falta en la etapa 2 su respuesta ya está en vuelo o lista, y si
+    # no, el resultado queda en el cache de búsquedas para el próximo query
+    from concurrent.futures import TimeoutError as FuturesTimeoutError
+    _ddg_ex = ThreadPoolExecutor(max_workers=1)
+    ddg_future = _ddg_ex.submit(ddg_results, query, max_urls=8, timeout=timeout)
+    try:
+        for i, (pharmacy_info, future) in enumerate(futures, 1):
+            print(f"  [{i}/{len(pharmacies_to_search)}] Searching {pharmacy_info['name']}...")
+            try:
+                results = future.result()
+                print(f"    [DEBUG] {pharmacy_info['name']}: search_pharmacy_direct returned {len(results)} results")
+                for idx, result in enumerate(results):
+                    try:
+                        precio = result.get("Precio", "")
+                        producto = result.get("Producto (Marca comercial)", "")
+                        farmacia = result.get("Farmacia / Fuente", "")
+                        enlace = result.get("Enlace", "")
+                        key = _dedup_key(farmacia, precio, enlace)
                     
-                    print(f"    [DEBUG] {pharmacy_info['name']}: Result {idx+1}/{len(results)} - precio: '{precio}', producto: '{producto[:50]}', key: {key}")
+                        print(f"    [DEBUG] {pharmacy_info['name']}: Result {idx+1}/{len(results)} - precio: '{precio}', producto: '{producto[:50]}', key: {key}")
                     
-                    if key not in seen and precio:
-                        seen.add(key)
-                        out.append(result)
-                        print(f"    [OK] Found: {precio} - {producto[:50]} at {farmacia}")
-                        if len(out) >= max_sites:  # Stop if we have enough results
-                            break
-                    else:
-                        if key in seen:
-                            print(f"    [DEBUG] {pharmacy_info['name']}: Result {idx+1} skipped - duplicate key")
-                        elif not precio:
-                            print(f"    [WARN] {pharmacy_info['name']}: Result {idx+1} skipped - empty/invalid precio: '{precio}'")
-                except Exception as result_error:
-                    print(f"    [WARN] Error processing result from {pharmacy_info['name']}: {result_error}")
-                    import traceback
-                    print(traceback.format_exc())
-                    continue
-            if len(out) >= max_sites:
-                break
-        except KeyboardInterrupt:
-            print(f"    [WARN] Interrupted while searching {pharmacy_info['name']}")
-            raise
-        except Exception as e:
-            print(f"    [ERROR] Error with {pharmacy_info['name']}: {e}")
-            import traceback
-            print(traceback.format_exc())
-            # Continuar con la siguiente farmacia en lugar de detener todo
-            continue
+                        if key not in seen and precio:
+                            seen.add(key)
+                            out.append(result)
+                            print(f"    [OK] Found: {precio} - {producto[:50]} at {farmacia}")
+                            if len(out) >= max_sites:  # Stop if we have enough results
+                                break
+                        else:
+                            if key in seen:
+                                print(f"    [DEBUG] {pharmacy_info['name']}: Result {idx+1} skipped - duplicate key")
+                            elif not precio:
+                                print(f"    [WARN] {pharmacy_info['name']}: Result {idx+1} skipped - empty/invalid precio: '{precio}'")
+                    except Exception as result_error:
+                        print(f"    [WARN] Error processing result from {pharmacy_info['name']}: {result_error}")
+                        import traceback
+                        print(traceback.format_exc())
+                        continue
+                if len(out) >= max_sites:
+                    stop.set()  # los workers en vuelo abandonan en su próximo checkpoint
+                    break
+            except KeyboardInterrupt:
+                print(f"    [WARN] Interrupted while searching {pharmacy_info['name']}")
+                raise
+            except Exception as e:
+                print(f"    [ERROR] Error with {pharmacy_info['name']}: {e}")
+                import traceback
+                print(traceback.format_exc())
+                # Continuar con la siguiente farmacia en lugar de detener todo
+                continue
+    finally:
+        # No bloquear si cortamos por max_sites: los threads restantes
+        # terminan en background y sus futures pendientes se cancelan
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        # Sin cancel_futures: si la etapa 2 corre, ddg_future sigue siendo
+        # utilizable; si no, el worker termina en background y alimenta el cache
+        _ddg_ex.shutdown(wait=False)
     
     # 2. Search using DuckDuckGo if we need more results
     if len(out) < 10:
         print("[INFO] Searching with DuckDuckGo...")
         try:
-            ddg_urls = ddg_results(query, max_urls=8, timeout=timeout)
-            for i, url in enumerate(ddg_urls[:5], 1):  # Limit to first 5 URLs
-                print(f"  [{i}/5] Checking DuckDuckGo result...")
+            # Timeout de pared duro: el read-timeout de requests solo mide
+            # el gap entre bytes, un server que gotea puede colgar el worker
+            try:
+                ddg_urls = ddg_future.result(timeout=timeout * 2)
+            except FuturesTimeoutError:
+                print(f"    [WARN] DuckDuckGo excedió {timeout * 2}s de pared; se omite")
+                ddg_urls = []
+            # Dedup antes de gastar presupuesto HTTP: DDG suele repetir URLs
+            # entre queries y los dominios ya raspados en la etapa 1 no aportan
+            seen_domains = {urlparse(r.get("Enlace", "")).netloc.replace("www.", "")
+                            for r in out if r.get("Enlace")}
+            ddg_urls = [u for u in dict.fromkeys(ddg_urls)
+                        if urlparse(u).netloc.replace("www.", "") not in seen_domains][:5]
+            # Descargar los candidatos en paralelo en lugar de uno por uno
+            pages = fetch_urls_concurrently(ddg_urls, timeout=timeout)
+            # Parsear las páginas descargadas en el pool de procesos: el
+            # extract es CPU puro y así escala a varios cores
+            pool = _get_parse_pool()
+            futures = {}
+            if pool is not None:
+                for url, html in pages.items():
+                    if html:
+                        try:
+                            futures[url] = pool.submit(extract_product_info, html, url)
+                        except Exception:
+                            pass
+            for i, url in enumerate(ddg_urls, 1):  # Already deduped and capped at 5
+                print(f"  [{i}/{len(ddg_urls)}] Checking DuckDuckGo result...")
                 try:
-                    r = requests.get(url, headers=HDRS, timeout=timeout)
-                    if r.status_code == 200:
-                        info = extract_product_info(r.text, url)
+                    html = pages.get(url)
+                    if html:
+                        fut = futures.get(url)
+                        info = fut.result(timeout=max(timeout, 15)) if fut is not None else extract_product_info(html, url)
                         if info.get("price"):
                             dom = urlparse(url).netloc.replace("www.", "")
-                            key = (dom, info["price"], url)
+                            key = _dedup_key(dom, info["price"], url)
                             if key not in seen:
                                 seen.add(key)
                                 out.append({
@@ -2013,16 +3176,49 @@ def fetch_prices_online(query: str, selected_pharmacies: list = None, max_sites:
     return out[:max_sites]  # Limit results
 
 # --------- Helpers front ----------
+# orjson serializa a bytes en C (~3-5x más rápido que el encoder de Flask
+# para estos payloads de dicts con claves repetidas); sin orjson, jsonify
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def ojsonify(obj):
+    if orjson is None:
+        return jsonify(obj)
+    return app.response_class(orjson.dumps(obj, default=str),
+                              mimetype="application/json")
+
+_PRICE_NUM_RE = re.compile(r"(\d+(?:\.\d{2})?)")
+
 def extract_price_number(txt):
     if not isinstance(txt, str): return None
-    txt = txt.replace(",", ".")
-    m = re.search(r"(\d+(?:\.\d{2})?)", txt)
+    if "," in txt:
+        txt = txt.replace(",", ".")
+    m = _PRICE_NUM_RE.search(txt)
     return float(m.group(1)) if m else None
 
+def _price_cents(txt):
+    """Precio como céntimos enteros; -1 si no se puede parsear"""
+    v = extract_price_number(str(txt) if txt is not None else "")
+    return int(round(v * 100)) if v is not None else -1
+
+def _row_price_cents(r):
+    """Céntimos de una fila: usa _PRICE_CENTS si viene precalculado"""
+    c = r.get("_PRICE_CENTS")
+    if isinstance(c, (int, float)) and c >= 0:
+        return int(c)
+    v = extract_price_number(r.get("Precio", ""))
+    return int(round(v * 100)) if v is not None else None
+
 def sort_rows(rows, col, asc=True):
     if col == "Precio":
-        return sorted(rows, key=lambda r: (extract_price_number(r.get("Precio","")) is None,
-                                           extract_price_number(r.get("Precio",""))), reverse=not asc)
+        # Decorate-sort-undecorate sobre céntimos enteros: cada precio se
+        # resuelve una sola vez y la comparación es entre ints
+        decorated = [(_row_price_cents(r), r) for r in rows]
+        decorated.sort(key=lambda t: (t[0] is None, t[0] if t[0] is not None else 0),
+                       reverse=not asc)
+        return [r for _, r in decorated]
     return sorted(rows, key=lambda r: str(r.get(col,"")).upper(), reverse=not asc)
 
 def last_modified_text(path):
@@ -2033,18 +3229,85 @@ def last_modified_text(path):
         return "—"
 
 # --------- Estado por sesión ----------
+# Las filas de resultados viven server-side: serializarlas en la cookie
+# firmada inflaba cada response varios KB y cada request re-verificaba el
+# HMAC de todo el payload. La cookie solo lleva un sid opaco. El estado va
+# en sqlite (WAL, como el cache de consultas) y no en un dict del proceso:
+# gunicorn corre con --workers 2 y cada request puede caer en otro worker.
+SESSION_STATE_DB = os.path.join(USER_DATA_DIR, "session_state.sqlite3")
+_SSTATE_LOCK = threading.Lock()
+_SSTATE_CONN = None
+_SESSION_STATE_TTL = 4 * 3600   # expirado -> el cliente simplemente re-busca
+
+def _sstate_conn():
+    global _SSTATE_CONN
+    if _SSTATE_CONN is None:
+        conn = sqlite3.connect(SESSION_STATE_DB, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS state(
+            sid TEXT PRIMARY KEY, ts REAL, payload BLOB)""")
+        conn.commit()
+        _SSTATE_CONN = conn
+    return _SSTATE_CONN
+
+def _new_state():
+    return {
+        "rows": [],
+        "digemid_rows": [],
+        "filters": {"pharmacies": []},
+        "sort": {"col":"Precio","asc":True},
+        "digemid_sort": {"col":"Precio","asc":True},
+        "_ts": time.time(),
+    }
+
 def get_state():
-    if "state" not in session:
-        session["state"] = {
-            "rows": [],
-            "digemid_rows": [],
-            "filters": {"pharmacies": []},
-            "sort": {"col":"Precio","asc":True},
-            "digemid_sort": {"col":"Precio","asc":True},
-        }
-    return session["state"]
+    sid = session.get("sid")
+    if not sid:
+        sid = os.urandom(16).hex()
+        session["sid"] = sid
+    # Cookies de versiones previas traían el estado completo: descartarlo
+    session.pop("state", None)
+    now = time.time()
+    st = None
+    try:
+        with _SSTATE_LOCK:
+            row = _sstate_conn().execute(
+                "SELECT ts, payload FROM state WHERE sid=?", (sid,)).fetchone()
+        if row is not None and now - row[0] <= _SESSION_STATE_TTL:
+            st = pickle.loads(row[1])
+    except Exception as e:
+        print(f"[WARN] No se pudo leer estado de sesión: {e}")
+    if st is None:
+        st = _new_state()
+    st["_ts"] = now
+    st["_sid"] = sid
+    return st
+
+def save_state(st):
+    """Persiste el estado mutado; cualquier worker lo ve en su próximo read"""
+    try:
+        payload = pickle.dumps(st, protocol=pickle.HIGHEST_PROTOCOL)
+        with _SSTATE_LOCK:
+            conn = _sstate_conn()
+            conn.execute("INSERT OR REPLACE INTO state(sid, ts, payload) VALUES(?,?,?)",
+                         (st.get("_sid", ""), st["_ts"], payload))
+            # Purga oportunista de sesiones vencidas en el mismo commit
+            conn.execute("DELETE FROM state WHERE ts < ?",
+                         (time.time() - _SESSION_STATE_TTL,))
+            conn.commit()
+    except Exception as e:
+        print(f"[WARN] No se pudo guardar estado de sesión: {e}")
 
 # --------- Rutas Auth ----------
+@app.before_request
+def _load_user():
+    # La cookie de sesión se deserializa una sola vez por request; el resto
+    # del código lee g.user / g.role / g.username sin volver a tocar session
+    user = session.get("user") or {}
+    g.user = user
+    g.role = user.get("role", "consulta")
+    g.username = user.get("username", "")
+
 @app.route("/login", methods=["GET","POST"])
 def login():
     if request.method == "POST":
@@ -2055,7 +3318,18 @@ def login():
             session["user"] = {"username":u, "role":role}
             return redirect(url_for("home"))
         return _html_login(error="Usuario o contraseña incorrectos.")
-    return _html_login()
+    # Página canónica: 304 si el cliente ya la tiene, gzip pre-comprimido si no
+    if request.headers.get("If-None-Match") == _LOGIN_ETAG:
+        return "", 304, {"ETag": _LOGIN_ETAG}
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        resp = app.response_class(_LOGIN_GZ, mimetype="text/html")
+        resp.headers["Content-Encoding"] = "gzip"
+        resp.headers["Vary"] = "Accept-Encoding"
+        resp.headers["ETag"] = _LOGIN_ETAG
+        return resp
+    resp = app.response_class(_html_login(), mimetype="text/html")
+    resp.headers["ETag"] = _LOGIN_ETAG
+    return resp
 
 @app.route("/logout")
 def logout():
@@ -2100,7 +3374,7 @@ def api_pharmacies():
         return jsonify({"error":"unauth"}), 401
     
     pharmacies = [{"name": p["name"], "base_url": p["base_url"]} for p in PERUVIAN_PHARMACIES]
-    return jsonify({"pharmacies": pharmacies})
+    return ojsonify({"pharmacies": pharmacies})
 
 @app.route("/api/search")
 def api_search():
@@ -2118,10 +3392,11 @@ def api_search():
     if not q:
         st = get_state()
         st["rows"] = []
+        save_state(st)
         session.modified = True
-        return jsonify({
-            "rows":[], 
-            "pharmacies":[], 
+        return ojsonify({
+            "rows":[],
+            "pharmacies":[],
             "base_last": last_modified_text(EXCEL_PATH),
             "extra_last": last_modified_text(EXCEL_EXTRA_PATH)
         })
@@ -2137,32 +3412,20 @@ def api_search():
             if not df.empty:
                 qU = q.upper()
                 if scope == "PRODUCTO":
-                    mask = df["Producto (Marca comercial)"].astype(str).str.contains(qU, regex=False, na=False)
+                    cols = ("_PROD_U",)
                 elif scope == "PRINCIPIO ACTIVO":
-                    mask = df["Principio Activo"].astype(str).str.contains(qU, regex=False, na=False)
+                    cols = ("_PA_U",)
                 else: # AMBOS
-                    mask = (df["Producto (Marca comercial)"].astype(str).str.contains(qU, regex=False, na=False) | 
-                           df["Principio Activo"].astype(str).str.contains(qU, regex=False, na=False))
-                
-                df_filtered = df[mask]
+                    cols = ("_PROD_U", "_PA_U")
+                df_filtered = _contains_filter(df, qU, cols)
                 print(f"Found {len(df_filtered)} matching rows")  # Debug
                 
-                for _, r in df_filtered.iterrows():
-                    rows.append({
-                        "CÓDIGO PRODUCTO":        r.get("CÓDIGO PRODUCTO",""),
-                        "Producto (Marca comercial)": r.get("Producto (Marca comercial)",""),
-                        "Principio Activo":       r.get("Principio Activo",""),
-                        "N° DIGEMID":             r.get("N° DIGEMID",""),
-                        "Laboratorio / Fabricante": r.get("Laboratorio / Fabricante",""),
-                        "Presentación":           r.get("Presentación",""),
-                        "Precio":                 r.get("Precio",""),
-                        "Farmacia / Fuente":      r.get("Farmacia / Fuente",""),
-                        "Enlace":                 r.get("Enlace",""),
-                        "GRUPO":                  r.get("GRUPO",""),
-                        "Laboratorio Abreviado":  r.get("Laboratorio Abreviado",""),
-                        "LABORATORIO PRECIO":     r.get("LABORATORIO PRECIO",""),
-                        "_ORIGEN":                r.get("_ORIGEN","BASE"),
-                    })
+                # to_dict('records') materializa los dicts en C; iterrows
+                # construye una Series por fila y es un orden de magnitud más lento
+                out_cols = BASE_COLUMNS_STD + EXTRA_COLUMNS + ["_ORIGEN", "_PRICE_CENTS"]
+                df_out = df_filtered.reindex(columns=out_cols, fill_value="")
+                df_out = df_out.astype(object).where(df_out.notna(), "")
+                rows.extend(df_out.to_dict("records"))
         except Exception as e:
             print(f"Error in base search: {e}")  # Debug
 
@@ -2183,6 +3446,7 @@ def api_search():
                 r.setdefault("GRUPO","")
                 r.setdefault("Laboratorio Abreviado","")
                 r.setdefault("LABORATORIO PRECIO","")
+                r["_PRICE_CENTS"] = _price_cents(r.get("Precio",""))
             rows += web_rows
         except Exception as e:
             print(f"Error in web search: {e}")  # Debug
@@ -2192,11 +3456,12 @@ def api_search():
     st["rows"] = rows
     st["filters"]["pharmacies"] = []  # limpiar
     st["sort"] = {"col":"Precio","asc":True}
+    save_state(st)
     session.modified = True
 
     print(f"Total results: {len(rows)}")  # Debug
 
-    return jsonify({
+    return ojsonify({
         "rows": rows,
         "pharmacies": sorted(list({r.get("Farmacia / Fuente","") for r in rows if r.get("Farmacia / Fuente")}))
                      [:200],
@@ -2232,7 +3497,7 @@ def api_view():
 
     # min/max (en todo el set post-filtro farmacia)
     def minmax(all_rows):
-        vals = [(extract_price_number(r.get("Precio","")), r) for r in all_rows]
+        vals = [(_row_price_cents(r), r) for r in all_rows]
         vals = [(v,r) for (v,r) in vals if v is not None]
         if not vals: return None, None
         rmin = min(vals, key=lambda x:x[0])[1]
@@ -2241,7 +3506,7 @@ def api_view():
 
     rmin, rmax = minmax(rows)
 
-    return jsonify({
+    return ojsonify({
         "rows": rows_page,
         "total": total,
         "page": page,
@@ -2256,7 +3521,7 @@ def api_view():
 
 @app.route("/api/export")
 def api_export():
-    if "user" not in session: return jsonify({"error":"unauth"}), 401
+    if "user" not in session: return ojsonify({"error":"unauth"}), 401
     st = get_state()
     rows = list(st["rows"])
     pharm_sel = request.args.getlist("pharmacy")
@@ -2266,7 +3531,7 @@ def api_export():
     asc = request.args.get("sort_asc","true").lower() == "true"
     rows = sort_rows(rows, col, asc)
     if not rows:
-        return jsonify({"error":"no_data"}), 400
+        return ojsonify({"error":"no_data"}), 400
 
     # Orden de columnas “bonito”
     cols = [c for c in DEFAULT_UI_ORDER if any(c in r for r in rows)]
@@ -2274,35 +3539,58 @@ def api_export():
 
     fmt = request.args.get("fmt","csv").lower()
     if fmt == "xlsx":
+        import xlsxwriter
         bio = io.BytesIO()
-        with pd.ExcelWriter(bio, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="Resultados")
-            wb  = writer.book
-            ws  = writer.sheets["Resultados"]
-            header_fmt = wb.add_format({"bold": True, "bg_color": "#E6E6E6", "border":1})
-            cell_fmt   = wb.add_format({"border":1})
-            money_fmt  = wb.add_format({"border":1, "num_format": '"S/" #,##0.00'})
-            for colx, colname in enumerate(df.columns):
-                ws.write(0, colx, colname.upper(), header_fmt)
-            for rowx in range(len(df)):
-                for colx, colname in enumerate(df.columns):
-                    val = df.iloc[rowx, colx]
-                    fmt_cell = money_fmt if colname == "Precio" else cell_fmt
-                    ws.write(rowx+1, colx, val, fmt_cell)
-            # Anchos
-            for colx, colname in enumerate(df.columns):
-                width = max(12, min(45, int(df[colname].astype(str).str.len().clip(upper=80).max() + 4)))
-                ws.set_column(colx, colx, width)
+        # constant_memory: las filas se descargan al vuelo -> memoria plana
+        # sin importar el tamaño del filtrado (antes to_excel + reescritura
+        # celda a celda duplicaba el trabajo y retenía todo en RAM). Ojo:
+        # in_memory=True desactivaría constant_memory; xlsxwriter usa
+        # temporales para las filas y vuelca al BytesIO en close()
+        wb = xlsxwriter.Workbook(bio, {"constant_memory": True})
+        ws = wb.add_worksheet("Resultados")
+        header_fmt = wb.add_format({"bold": True, "bg_color": "#E6E6E6", "border":1})
+        cell_fmt   = wb.add_format({"border":1})
+        money_fmt  = wb.add_format({"border":1, "num_format": '"S/" #,##0.00'})
+        # Anchos antes de escribir (con constant_memory no se puede volver atrás),
+        # en una sola pasada vectorizada sobre todo el frame
+        widths = df.astype(str).apply(lambda s: s.str.len().clip(upper=80).max())
+        for colx, w in enumerate(widths):
+            ws.set_column(colx, colx, max(12, min(45, int(w) + 4)))
+        ws.write_row(0, 0, [c.upper() for c in df.columns], header_fmt)
+        # write_row escribe la fila completa en una llamada; el Precio se
+        # sobreescribe como número (misma fila, aún no descargada) para que
+        # Excel lo trate como moneda
+        price_colx = list(df.columns).index("Precio") if "Precio" in df.columns else -1
+        for rowx, row_vals in enumerate(df.itertuples(index=False, name=None), start=1):
+            ws.write_row(rowx, 0, row_vals, cell_fmt)
+            if price_colx >= 0:
+                num = extract_price_number(row_vals[price_colx])
+                if num is not None:
+                    ws.write_number(rowx, price_colx, num, money_fmt)
+        wb.close()
         bio.seek(0)
         fname = f"medicamentos_{datetime.datetime.now():%Y%m%d_%H%M%S}.xlsx"
         return send_file(bio, as_attachment=True, download_name=fname,
                          mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 
-    # CSV por defecto
-    csv_bytes = df.to_csv(index=False).encode("utf-8-sig")
-    bio = io.BytesIO(csv_bytes)
+    # CSV por defecto: pyarrow escribe en C (~5-10x más rápido que el writer
+    # de pandas en frames anchos de texto); BOM para que Excel respete acentos
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        buf = io.BytesIO()
+        pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
+        csv_bytes = b"\xef\xbb\xbf" + buf.getvalue()
+    except Exception:
+        csv_bytes = df.to_csv(index=False).encode("utf-8-sig")
     fname = f"medicamentos_{datetime.datetime.now():%Y%m%d_%H%M%S}.csv"
-    return send_file(bio, as_attachment=True, download_name=fname, mimetype="text/csv; charset=utf-8")
+    # Exportes grandes viajan comprimidos si el cliente lo acepta
+    if len(csv_bytes) > 256 * 1024 and "gzip" in (request.headers.get("Accept-Encoding") or ""):
+        resp = send_file(io.BytesIO(gzip.compress(csv_bytes, 6)), as_attachment=True,
+                         download_name=fname, mimetype="text/csv; charset=utf-8")
+        resp.headers["Content-Encoding"] = "gzip"
+        return resp
+    return send_file(io.BytesIO(csv_bytes), as_attachment=True, download_name=fname, mimetype="text/csv; charset=utf-8")
 
 # --------- API: Búsqueda DIGEMID ----------
 @app.route("/api/digemid/search")
@@ -2357,6 +3645,7 @@ def api_digemid_search():
     st = get_state()
     st["digemid_rows"] = rows
     st["digemid_sort"] = {"col":"Precio","asc":True}
+    save_state(st)
     session.modified = True
     
     return jsonify({
@@ -2393,7 +3682,7 @@ def api_digemid_view():
     
     # min/max
     def minmax(all_rows):
-        vals = [(extract_price_number(r.get("Precio","")), r) for r in all_rows]
+        vals = [(_row_price_cents(r), r) for r in all_rows]
         vals = [(v,r) for (v,r) in vals if v is not None]
         if not vals: return None, None
         rmin = min(vals, key=lambda x:x[0])[1]
@@ -2433,24 +3722,27 @@ def api_digemid_export():
     
     fmt = request.args.get("fmt","csv").lower()
     if fmt == "xlsx":
+        import xlsxwriter
         bio = io.BytesIO()
-        with pd.ExcelWriter(bio, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="DIGEMID")
-            wb  = writer.book
-            ws  = writer.sheets["DIGEMID"]
-            header_fmt = wb.add_format({"bold": True, "bg_color": "#E6E6E6", "border":1})
-            cell_fmt   = wb.add_format({"border":1})
-            money_fmt  = wb.add_format({"border":1, "num_format": '"S/" #,##0.00'})
-            for colx, colname in enumerate(df.columns):
-                ws.write(0, colx, colname.upper(), header_fmt)
-            for rowx in range(len(df)):
-                for colx, colname in enumerate(df.columns):
-                    val = df.iloc[rowx, colx]
-                    fmt_cell = money_fmt if colname == "Precio" else cell_fmt
-                    ws.write(rowx+1, colx, val, fmt_cell)
-            for colx, colname in enumerate(df.columns):
-                width = max(12, min(45, int(df[colname].astype(str).str.len().clip(upper=80).max() + 4)))
-                ws.set_column(colx, colx, width)
+        # Mismo streaming que api_export: constant_memory descarga cada fila
+        # al vuelo en vez de to_excel + reescritura celda a celda
+        wb = xlsxwriter.Workbook(bio, {"constant_memory": True})
+        ws = wb.add_worksheet("DIGEMID")
+        header_fmt = wb.add_format({"bold": True, "bg_color": "#E6E6E6", "border":1})
+        cell_fmt   = wb.add_format({"border":1})
+        money_fmt  = wb.add_format({"border":1, "num_format": '"S/" #,##0.00'})
+        widths = df.astype(str).apply(lambda s: s.str.len().clip(upper=80).max())
+        for colx, w in enumerate(widths):
+            ws.set_column(colx, colx, max(12, min(45, int(w) + 4)))
+        ws.write_row(0, 0, [c.upper() for c in df.columns], header_fmt)
+        price_colx = list(df.columns).index("Precio") if "Precio" in df.columns else -1
+        for rowx, row_vals in enumerate(df.itertuples(index=False, name=None), start=1):
+            ws.write_row(rowx, 0, row_vals, cell_fmt)
+            if price_colx >= 0:
+                num = extract_price_number(row_vals[price_colx])
+                if num is not None:
+                    ws.write_number(rowx, price_colx, num, money_fmt)
+        wb.close()
         bio.seek(0)
         fname = f"digemid_{datetime.datetime.now():%Y%m%d_%H%M%S}.xlsx"
         return send_file(bio, as_attachment=True, download_name=fname,
@@ -2479,6 +3771,8 @@ def api_admin_upload_base():
         df = normalize_from_main(raw) if which=="main" else normalize_from_extra(raw)
         dst = EXCEL_PATH if which=="main" else EXCEL_EXTRA_PATH
         df.to_excel(dst, index=False)
+        global _FILES_READY
+        _FILES_READY = False  # re-verificar en la próxima búsqueda
         return jsonify({"ok":True, "which":which})
     except Exception as e:
         return jsonify({"error":str(e)}), 500
@@ -2552,6 +3846,19 @@ def api_admin_upload_digemid():
             pass
 
 # --------- CRUD Operations (solo admin) ----------
+@app.route("/api/admin/clear_caches", methods=["POST"])
+def api_admin_clear_caches():
+    """Vacía los caches de buscadores y de páginas descargadas"""
+    if "user" not in session: return jsonify({"error":"unauth"}), 401
+    if session["user"].get("role") != "admin": return jsonify({"error":"forbidden"}), 403
+    with _SEARCH_CACHE_LOCK:
+        n_search = len(_SEARCH_CACHE)
+        _SEARCH_CACHE.clear()
+    with _PAGE_CACHE_LOCK:
+        n_pages = len(_PAGE_CACHE)
+        _PAGE_CACHE.clear()
+    return jsonify({"ok": True, "searches": n_search, "pages": n_pages})
+
 @app.route("/api/admin/add_row", methods=["POST"])
 def api_admin_add_row():
     if "user" not in session: return jsonify({"error":"unauth"}), 401
@@ -2799,335 +4106,152 @@ def api_admin_delete_user(username):
         return jsonify({"error":str(e)}), 500
 
 # --------- HTMLs ----------
+# Rutas sin parámetros resueltas una sola vez: evita que cada render pase por
+# MapAdapter.build() de Werkzeug para URLs que nunca cambian
+with app.test_request_context():
+    _HOME_URL = url_for("home")
+    _LOGIN_URL = url_for("login")
+    _LOGOUT_URL = url_for("logout")
+    _DIGEMID_URL = url_for("digemid")
+# Entorno Jinja propio: cada plantilla se compila a bytecode una sola vez
+# (auto_reload=False) y los renders siguientes salen del cache compilado
+from jinja2 import Environment, FileSystemLoader
+JINJA_ENV = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")),
+    auto_reload=False, cache_size=400)
+
+# Compilación anticipada: las plantillas se convierten a bytecode en el import
+# y quedan en el cache del Environment, así el primer request no paga el parse
+for _t in ("login.html", "home.html", "admin_panel.html"):
+    try:
+        JINJA_ENV.get_template(_t)
+    except Exception as e:
+        print(f"No se pudo precompilar {_t}: {e}")
+
+_STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+@lru_cache(maxsize=16)
+def _static_v(fname):
+    """Hash corto del contenido de un asset estático para versionar su URL"""
+    try:
+        with open(os.path.join(_STATIC_DIR, fname), "rb") as f:
+            return hashlib.blake2b(f.read(), digest_size=4).hexdigest()
+    except Exception:
+        return "0"
+
+def _minify_css(text):
+    """Quita comentarios y espacio redundante; no toca los selectores"""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};:,>])\s*", r"\1", text)
+    return text.replace(";}", "}").strip()
+
+def _ensure_min_css():
+    # Variantes .min.css generadas una vez al importar y solo si la fuente
+    # cambió; las páginas enlazan siempre la versión minificada
+    for fname in ("login.css", "home.css", "digemid.css"):
+        src = os.path.join(_STATIC_DIR, fname)
+        dst = os.path.join(_STATIC_DIR, fname[:-4] + ".min.css")
+        try:
+            if not os.path.exists(dst) or os.path.getmtime(dst) < os.path.getmtime(src):
+                with open(src, "r", encoding="utf-8") as f:
+                    mini = _minify_css(f.read())
+                with open(dst, "w", encoding="utf-8") as f:
+                    f.write(mini)
+        except Exception as e:
+            print(f"No se pudo minificar {fname}: {e}")
+
+_ensure_min_css()
+
 def _html_login(error=None):
-    return f"""<!doctype html>
-<html lang="es">
-<head>
-<meta charset="utf-8">
-<title>Login · {APP_TITLE}</title>
-<meta name="viewport" content="width=device-width,initial-scale=1">
-<style>
-:root {{
-  --bg:#0e2a47; --card:#101826; --muted:#7e8ea0; --acc:#1dd1a1; --txt:#e8eef6; --danger:#ff6b6b;
-}}
-* {{ box-sizing: border-box; }}
-html,body {{ margin:0; height:100%; font-family:ui-sans-serif,system-ui,Segoe UI,Roboto,Arial; color:var(--txt);
-            background:linear-gradient(135deg,#0e2a47 0%, #102a44 60%, #0a1c2f 100%); }}
-.wrapper {{ min-height:100%; display:grid; place-items:center; padding:24px; }}
-.card {{
-  width:min(940px, 96vw); display:grid; grid-template-columns: 1.1fr 0.9fr; gap:0;
-  background:linear-gradient(180deg, rgba(255,255,255,0.03), rgba(255,255,255,0.01));
-  border:1px solid rgba(255,255,255,0.06); border-radius:18px; overflow:hidden; box-shadow:0 10px 40px rgba(0,0,0,.35);
-}}
-.left {{ padding:36px 32px; background:rgba(3,12,22,.55); }}
-.brand {{ display:flex; justify-content:space-between; align-items:center; margin-bottom:8px; }}
-.brand h1 {{ margin:0; font-size:24px; letter-spacing:.5px; }}
-.brand small {{ color:var(--muted); }}
-h2 {{ margin:10px 0 18px; font-size:18px; color:var(--muted); }}
-label {{ display:block; font-size:14px; margin:12px 0 6px; color:#c5d3e6; }}
-input[type=text], input[type=password] {{
-  width:100%; padding:12px 14px; border-radius:12px; border:1px solid rgba(255,255,255,0.12);
-  background:#0b1726; color:var(--txt); outline:none;
-}}
-input:focus {{ border-color:var(--acc); box-shadow:0 0 0 3px rgba(29,209,161,.15); }}
-.actions {{ display:flex; gap:10px; margin-top:16px; }}
-button {{
-  padding:10px 14px; border-radius:12px; border:1px solid rgba(255,255,255,0.12);
-  background:var(--acc); color:#082019; font-weight:700; cursor:pointer;
-}}
-button.secondary {{ background:transparent; color:var(--txt); }}
-a.link {{ color:#7fe9cf; text-decoration:none; font-size:13px }}
-.right {{
-  background: radial-gradient(1200px 600px at 80% -10%, rgba(29,209,161,.25), transparent 60%),
-              linear-gradient(180deg, #0b2644, #0a1e37);
-  display:grid; place-items:center; padding:20px;
-}}
-.logo-container {{
-  display: flex; align-items: center; justify-content: center;
-  width: min(420px, 36vw); height: min(420px, 36vw);
-  background: radial-gradient(closest-side, rgba(255,255,255,.12), rgba(255,255,255,.04) 60%, transparent 62%),
-              conic-gradient(from 0deg, rgba(127,233,207,.15), rgba(255,255,255,.04), rgba(127,233,207,.15));
-  border: 1px solid rgba(255,255,255,.08);
-  border-radius: 20px;
-  box-shadow: inset 0 0 40px rgba(255,255,255,.06), 0 10px 60px rgba(0,0,0,.35);
-  padding: 20px;
-}}
-.login-logo {{
-  max-width: 80%; max-height: 80%; 
-  object-fit: contain; border-radius: 12px;
-  background: rgba(255,255,255,.9); padding: 8px;
-  box-shadow: 0 4px 20px rgba(0,0,0,.2);
-}}
-.error {{ color:var(--danger); margin-top:8px; font-size:14px }}
-@media (max-width:840px) {{
-  .card {{ grid-template-columns:1fr; }}
-  .right {{ display:none; }}
-}}
-</style>
-</head>
-<body>
-<div class="wrapper">
-  <div class="card">
-    <div class="left">
-      <div class="brand"><h1>AVision</h1><small>v {APP_VERSION}</small></div>
-      <h2>A&V para decisiones inteligentes, a tiempo</h2>
-      <form method="post">
-        <label>Usuario</label>
-        <input name="username" type="text" placeholder="admin o consulta" required>
-        <label>Contraseña</label>
-        <input name="password" type="password" placeholder="••••••••" required>
-        <div class="actions">
-          <button type="submit">Ingresar</button>
-          <a class="link" href="https://ayvservice.wixsite.com/my-site-1" target="_blank">ayvservice.wixsite.com</a>
-        </div>
-        {"<div class='error'>"+error+"</div>" if error else ""}
-      </form>
-    </div>
-    <div class="right">
-      <div class="logo-container">
-        <img src="/static/logo" alt="Logo" class="login-logo">
-      </div>
-    </div>
-  </div>
-</div>
-</body>
-</html>"""
+    return JINJA_ENV.get_template("login.html").render(
+        error=error, APP_TITLE=APP_TITLE, APP_VERSION=APP_VERSION,
+        css_v=_static_v("login.min.css"))
 
-def _html_home():
-    user = session.get("user",{})
-    role = user.get("role","consulta")
-    base_last  = last_modified_text(EXCEL_PATH)
-    extra_last = last_modified_text(EXCEL_EXTRA_PATH)
-    admin_panel = f"""
-    <details class="admin">
-      <summary>⚙️ Panel Admin</summary>
-      <div class="admin-grid">
-        <div>
-          <h4>Subir BASE (fuente.xlsx)</h4>
-          <form id="formBase" enctype="multipart/form-data">
-            <input type="file" name="file" accept=".xlsx,.xls,.csv" required>
-            <button type="submit">Subir BASE</button>
-          </form>
-        </div>
-        <div>
-          <h4>Subir EXTRA (productos1.xlsx)</h4>
-          <form id="formExtra" enctype="multipart/form-data">
-            <input type="file" name="file" accept=".xlsx,.xls,.csv" required>
-            <button type="submit">Subir EXTRA</button>
-          </form>
-        </div>
-        <div>
-          <h4>Cambiar LOGO</h4>
-          <img src="/static/logo" alt="Logo actual" style="max-width:180px; display:block; margin-bottom:8px; background:#fff;border-radius:8px;padding:6px;">
-          <form id="formLogo" enctype="multipart/form-data">
-            <input type="file" name="file" accept=".png,.jpg,.jpeg,.gif,.bmp" required>
-            <button type="submit">Subir LOGO</button>
-          </form>
-        </div>
-        <div>
-          <h4>Gestión de Usuarios</h4>
-          <button id="btnManageUsers">👥 Gestionar Usuarios</button>
-        </div>
-      </div>
-      <small class="muted">Últimas modificaciones · BASE: {base_last} · EXTRA: {extra_last}</small>
-    </details>
-    """ if role=="admin" else ""
+# Login canónico (sin error) pre-comprimido en el import: el HTML es estático,
+# así que se sirve el mismo gzip + ETag a todos y solo se re-renderiza en vivo
+# cuando hay mensaje de error
+_LOGIN_GZ = gzip.compress(_html_login().encode("utf-8"), 6)
+_LOGIN_ETAG = '"' + hashlib.blake2b(_LOGIN_GZ, digest_size=8).hexdigest() + '"'
 
-    return f"""<!doctype html>
-<html lang="es">
-<head>
-<meta charset="utf-8">
-<title>{APP_TITLE}</title>
-<meta name="viewport" content="width=device-width,initial-scale=1">
-<style>
-:root {{ --bg:#0e2a47; --panel:#0b1726; --muted:#8aa0b8; --acc:#1dd1a1; --txt:#eaf2fb; --line:#17263a; --chip:#102136; }}
-html,body {{ margin:0; height:100%; background:linear-gradient(180deg, #0e2a47, #0d1f37); color:var(--txt); font-family:ui-sans-serif,system-ui,Segoe UI,Roboto,Arial; }}
-.topbar {{
-  display:flex; align-items:center; gap:12px; padding:12px 16px; border-bottom:1px solid var(--line);
-  background:linear-gradient(180deg, rgba(255,255,255,.04), rgba(255,255,255,.02));
-}}
-.brand {{ font-weight:800; letter-spacing:.3px }}
-.version {{ color:var(--muted); font-size:12px; margin-left:auto; }}
-.topbar img {{ height:40px; border-radius:8px; background:#fff; padding:4px; }}
-button, select {{ background:var(--acc); color:#082019; border:none; padding:8px 12px; border-radius:12px; font-weight:700; cursor:pointer; }}
-select, input[type=number] {{ color:#0c2238; }}
-input[type=text] {{
-  width:36ch; max-width:70vw; padding:10px 12px; border-radius:12px; border:1px solid rgba(255,255,255,0.14);
-  background:var(--panel); color:var(--txt);
-}}
-.controls {{ display:flex; flex-wrap:wrap; gap:8px; padding:10px 16px; align-items:center; border-bottom:1px solid var(--line); }}
-.controls .pill {{ background:var(--chip); border:1px solid var(--line); padding:8px 10px; border-radius:12px; display:flex; gap:8px; align-items:center; }}
-main {{ padding:12px 16px; }}
-.grid {{ display:grid; grid-template-columns: 1fr; gap:12px; }}
-.table-wrap {{ background:rgba(3,12,22,.55); border:1px solid var(--line); border-radius:14px; overflow:auto; }}
-table {{ width:100%; border-collapse:collapse; min-width:960px; }}
-th, td {{ padding:10px 12px; border-bottom:1px solid #12243a; text-align:left; }}
-th {{ position:sticky; top:0; background:#0c1b2f; z-index:1; cursor:pointer; }}
-td.price {{ text-align:right; white-space:nowrap; }}
-.rowlink a {{ color:#9aeed8; text-decoration:none; }}
-.meta {{ display:flex; gap:12px; align-items:center; flex-wrap:wrap; }}
-.kpi {{ padding:8px 10px; background:var(--chip); border:1px solid var(--line); border-radius:12px; }}
-footer {{ color:var(--muted); font-size:12px; text-align:center; padding:18px; }}
-.chips {{ display:flex; gap:6px; flex-wrap:wrap; }}
-.chip {{ background:var(--chip); border:1px solid var(--line); padding:5px 9px; border-radius:999px; font-size:12px; cursor:pointer; }}
-.chip.sel {{ outline:2px solid rgba(29,209,161,.4); }}
-.muted {{ color:var(--muted); }}
-details.admin {{ background:rgba(3,12,22,.4); border:1px solid var(--line); border-radius:12px; margin:10px 16px; padding:10px; }}
-details.admin summary {{ cursor:pointer; font-weight:700; }}
-.admin-grid {{ display:grid; grid-template-columns: repeat(auto-fit, minmax(260px, 1fr)); gap:14px; margin-top:8px; }}
-.admin-grid h4 {{ margin:.4rem 0 .6rem; }}
-.admin-grid input[type=file] {{ display:block; margin:.4rem 0; }}
-
-/* Modal styles */
-.modal-overlay {{
-  position: fixed; top: 0; left: 0; width: 100%; height: 100%;
-  background: rgba(0,0,0,0.7); display: flex; align-items: center; justify-content: center;
-  z-index: 1000;
-}}
-.modal-content {{
-  background: var(--panel); border: 1px solid var(--line); border-radius: 12px;
-  padding: 20px; max-width: 90vw; max-height: 90vh; overflow-y: auto;
-  box-shadow: 0 10px 40px rgba(0,0,0,0.5);
-}}
-.modal-content h3 {{ margin: 0 0 16px; color: var(--acc); }}
-.form-grid {{
-  display: grid; grid-template-columns: auto 1fr; gap: 8px 12px; align-items: center;
-  margin-bottom: 16px;
-}}
-.form-grid label {{ color: #c7d6ea; font-size: 13px; }}
-.form-grid input, .form-grid select {{
-  padding: 8px; border: 1px solid var(--line); border-radius: 6px;
-  background: var(--bg); color: var(--txt);
-}}
-.modal-buttons {{ display: flex; gap: 8px; justify-content: flex-end; margin-top: 16px; }}
-.modal-buttons button {{ padding: 8px 16px; }}
-
-/* User management styles */
-.user-management {{ display: grid; grid-template-columns: 1fr 1fr; gap: 20px; }}
-.user-list h4, .user-form h4 {{ margin: 0 0 12px; color: var(--acc); }}
-.user-item {{
-  display: flex; justify-content: space-between; align-items: center;
-  padding: 8px; background: var(--chip); border: 1px solid var(--line);
-  border-radius: 6px; margin-bottom: 6px;
-}}
-.user-actions {{ display: flex; gap: 4px; }}
-.user-actions button {{ padding: 4px 8px; font-size: 12px; }}
-.user-form form {{ display: flex; flex-direction: column; gap: 8px; }}
-.user-form input, .user-form select {{ padding: 8px; border: 1px solid var(--line); border-radius: 6px; }}
-
-/* Row selection */
-tr.selected {{ background: rgba(29,209,161,0.2) !important; }}
-tr:hover {{ background: rgba(255,255,255,0.05); }}
-</style>
-</head>
-<body>
-  <div class="topbar">
-    <img src="/static/logo" alt="Logo">
-    <div class="brand">AVision</div>
-    <div style="opacity:.7">|</div>
-    <div>{APP_TITLE}</div>
-    <div class="version">v {APP_VERSION}</div>
-    <div style="margin-left:auto; display:flex; gap:10px; align-items:center;">
-      <span style="color:var(--muted); font-size:13px;">{user.get("username")} · {user.get("role")}</span>
-      <a href="{url_for('logout')}" style="color:#9aeed8; text-decoration:none;">Salir</a>
-    </div>
-  </div>
+def _file_mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except Exception:
+        return 0.0
 
-  {admin_panel}
+def _mtime_text(ts):
+    if not ts:
+        return "—"
+    return datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
 
-  <div class="controls">
-    <div class="pill">
-      <label style="color:#c7d6ea; font-size:13px; white-space:nowrap;">Farmacias a buscar:</label>
-      <div id="pharmacySelectors" class="pharmacy-checkboxes"></div>
-    </div>
-    <div class="pill">
-      <span>🔎</span>
-      <input id="q" type="text" placeholder="Ej: paracetamol 500 mg">
-      <select id="scope">
-        <option>PRODUCTO</option>
-        <option>PRINCIPIO ACTIVO</option>
-        <option>AMBOS</option>
-      </select>
-      <select id="mode">
-        <option value="base">BASE</option>
-        <option value="web">WEB</option>
-        <option value="both" selected>AMBOS</option>
-      </select>
-      <button id="btnSearch">Buscar</button>
-    </div>
-    <div class="pill">
-      <label for="per" style="color:#c7d6ea; font-size:13px;">Filas/pág</label>
-      <select id="per">
-        <option>10</option><option selected>25</option><option>50</option><option>100</option>
-      </select>
-    </div>
-    <div class="pill">
-      <label style="color:#c7d6ea; font-size:13px;">Farmacias (filtro)</label>
-      <div id="pharmChips" class="chips"></div>
-    </div>
-    <div class="pill">
-      <button id="btnCsv">Exportar CSV</button>
-      <button id="btnXlsx">Exportar XLSX</button>
-    </div>
-    <div class="pill">
-      <a href="{url_for('digemid')}" style="background:var(--acc); color:#082019; border:none; padding:8px 12px; border-radius:12px; font-weight:700; cursor:pointer; text-decoration:none; display:inline-block;">🔍 Búsqueda DIGEMID</a>
-    </div>
-    {f'''
-    <div class="pill" id="crudButtons" style="display:none;">
-      <button id="btnAdd">➕ Agregar</button>
-      <button id="btnEdit">✏️ Editar</button>
-      <button id="btnDelete">🗑️ Eliminar</button>
-    </div>
-    ''' if role=="admin" else ""}
-  </div>
+# Cache de ~1 s para los textos de "Última modificación": bajo ráfagas de
+# renders se hace un solo par de stat() por segundo en vez de dos por página
+_last_mod_cache = {"t": 0.0, "v": None}
 
-  <main class="grid">
-    <div class="meta">
-      <div class="kpi" id="kpiCount">0 resultado(s)</div>
-      <div class="kpi" id="kpiMin">MENOR: —</div>
-      <button id="btnOpenMin" style="display:none;">Abrir (MENOR)</button>
-      <div class="kpi" id="kpiMax">MAYOR: —</div>
-      <button id="btnOpenMax" style="display:none;">Abrir (MAYOR)</button>
-      <div class="muted" id="lastMods" style="margin-left:auto;">BASE: {base_last} · EXTRA: {extra_last}</div>
-      <div style="display:flex; gap:8px; align-items:center;">
-        <button id="btnPrev">◀ Ant</button>
-        <div class="kpi" id="kpiPage">Pág 0/0</div>
-        <button id="btnNext">Sig ▶</button>
-      </div>
-    </div>
+def _mod_texts():
+    """(base_mtime, extra_mtime, base_last, extra_last) con TTL de 1 segundo"""
+    now = time.monotonic()
+    v = _last_mod_cache["v"]
+    if v is None or now - _last_mod_cache["t"] > 1.0:
+        bm, em = _file_mtime(EXCEL_PATH), _file_mtime(EXCEL_EXTRA_PATH)
+        v = (bm, em, _mtime_text(bm), _mtime_text(em))
+        _last_mod_cache["t"] = now
+        _last_mod_cache["v"] = v
+    return v
 
-    <div class="table-wrap">
-      <table id="tbl">
-        <thead>
-          <tr>
-            <th data-col="Producto (Marca comercial)">Producto</th>
-            <th data-col="Principio Activo">P. Activo</th>
-            <th data-col="Presentación">Presentación</th>
-            <th data-col="Precio">Precio</th>
-            <th data-col="Laboratorio / Fabricante">Laboratorio</th>
-            <th data-col="Farmacia / Fuente">Farmacia / Fuente</th>
-            <th data-col="Enlace">Enlace</th>
-            <th data-col="GRUPO">Grupo</th>
-          </tr>
-        </thead>
-        <tbody></tbody>
-      </table>
-    </div>
-  </main>
+@lru_cache(maxsize=8)
+def _render_admin_panel(base_mtime, extra_mtime):
+    # El fragmento solo cambia cuando cambian los mtimes de los Excel: con
+    # inputs idénticos se devuelve el string ya renderizado sin interpolar nada
+    return JINJA_ENV.get_template("admin_panel.html").render(
+        base_last=_mtime_text(base_mtime), extra_last=_mtime_text(extra_mtime))
 
-  <footer>Hecho con ♥ · A&V · Copyright ©Relexner v {APP_VERSION}</footer>
+def _prerender_home(role):
+    # Render de especialización: el branch admin/consulta y las constantes del
+    # proceso se resuelven aquí; los 4 campos por request quedan como huecos $
+    return JINJA_ENV.get_template("home.html").render(
+        APP_TITLE=APP_TITLE, APP_VERSION=APP_VERSION,
+        user_info="$user_info", role=role, admin_panel="$admin_panel",
+        base_last="$base_last", extra_last="$extra_last",
+        digemid_url=_DIGEMID_URL, logout_url=_LOGOUT_URL,
+        css_v=_static_v("home.min.css"), js_v=_static_v("app.js"))
 
-<script src="/static/app.js"></script>
-</body>
-</html>"""
+# Cada variante troceada en sus huecos al importar (en la de consulta el
+# panel admin ya se resolvió a vacío); el render intercala segmento estático
+# y valor dinámico y el servidor escribe al socket pieza a pieza
+_HOME_PARTS = {}
+for _r in ("admin", "consulta"):
+    _pre = _prerender_home(_r)
+    if _r != "admin":
+        _pre = Template(_pre).safe_substitute(admin_panel="")
+    _HOME_PARTS[_r] = [sys.intern(_p) for _p in
+                       re.split(r"\$(user_info|admin_panel|base_last|extra_last)", _pre)]
 
-def _html_digemid():
-    """Página HTML para búsqueda DIGEMID"""
-    user = session.get("user",{})
-    role = user.get("role","consulta")
-    digemid_last = last_modified_text(EXCEL_DIGEMID_PATH)
-    
-    admin_panel = f"""
+@lru_cache(maxsize=64)
+def _user_info_text(username, role):
+    # El mismo usuario repite navegación: el texto "usuario · rol" se arma una vez
+    return f"{username} · {role}"
+
+def _home_gen(parts, ctx):
+    # Posiciones impares = nombre de hueco capturado por el split
+    for i, piece in enumerate(parts):
+        yield piece if not i % 2 else ctx.get(piece, "")
+
+def _html_home():
+    user, role = g.user, g.role
+    base_mtime, extra_mtime, base_last, extra_last = _mod_texts()
+    ctx = {"user_info": _user_info_text(user.get("username"), user.get("role")),
+           "base_last": base_last, "extra_last": extra_last}
+    if role == "admin":
+        ctx["admin_panel"] = _render_admin_panel(base_mtime, extra_mtime)
+    parts = _HOME_PARTS.get(role) or _HOME_PARTS["consulta"]
+    return Response(stream_with_context(_home_gen(parts, ctx)), mimetype="text/html")
+
+
+# Panel admin de DIGEMID como constante de módulo: el único dato dinámico es
+# la fecha de modificación, que se inserta con .format por request
+_DIGEMID_ADMIN_TMPL = """
     <details class="admin">
       <summary>⚙️ Panel Admin - DIGEMID</summary>
       <div class="admin-grid">
@@ -3142,50 +4266,40 @@ def _html_digemid():
       </div>
       <small class="muted">Última modificación: {digemid_last}</small>
     </details>
-    """ if role=="admin" else ""
-    
-    return f"""<!doctype html>
+    """
+assert _DIGEMID_ADMIN_TMPL.count("{") == 1  # solo el hueco de digemid_last
+_DIGEMID_ADMIN_TMPL = sys.intern(_DIGEMID_ADMIN_TMPL)
+
+def _html_digemid():
+    """Página HTML para búsqueda DIGEMID"""
+    user, role = g.user, g.role
+    digemid_last = last_modified_text(EXCEL_DIGEMID_PATH)
+
+    s = _DIGEMID_PARTS
+    # Escritura incremental sobre un buffer que crece amortizado O(n); los
+    # bloques condicionales (panel admin) solo se escriben cuando aplican
+    buf = io.StringIO()
+    w = buf.write
+    w(s[0]); w(_HOME_URL)
+    w(s[1]); w(_user_info_text(user.get("username"), user.get("role")))
+    w(s[2]); w(_LOGOUT_URL)
+    w(s[3])
+    if role == "admin":
+        w(_DIGEMID_ADMIN_TMPL.format(digemid_last=digemid_last))
+    w(s[4]); w(digemid_last)
+    w(s[5])
+    return buf.getvalue()
+
+# Página DIGEMID: segmentos estáticos pre-renderizados una vez al importar
+# (título/versión/CSS ya horneados); los 5 huecos dinámicos se rellenan por
+# request en _html_digemid
+_DIGEMID_PARTS = f"""<!doctype html>
 <html lang="es">
 <head>
 <meta charset="utf-8">
 <title>Búsqueda DIGEMID · {APP_TITLE}</title>
 <meta name="viewport" content="width=device-width,initial-scale=1">
-<style>
-:root {{ --bg:#0e2a47; --panel:#0b1726; --muted:#8aa0b8; --acc:#1dd1a1; --txt:#eaf2fb; --line:#17263a; --chip:#102136; }}
-html,body {{ margin:0; height:100%; background:linear-gradient(180deg, #0e2a47, #0d1f37); color:var(--txt); font-family:ui-sans-serif,system-ui,Segoe UI,Roboto,Arial; }}
-.topbar {{
-  display:flex; align-items:center; gap:12px; padding:12px 16px; border-bottom:1px solid var(--line);
-  background:linear-gradient(180deg, rgba(255,255,255,.04), rgba(255,255,255,.02));
-}}
-.brand {{ font-weight:800; letter-spacing:.3px }}
-.version {{ color:var(--muted); font-size:12px; margin-left:auto; }}
-.topbar img {{ height:40px; border-radius:8px; background:#fff; padding:4px; }}
-button, select {{ background:var(--acc); color:#082019; border:none; padding:8px 12px; border-radius:12px; font-weight:700; cursor:pointer; }}
-select, input[type=number] {{ color:#0c2238; }}
-input[type=text] {{
-  width:36ch; max-width:70vw; padding:10px 12px; border-radius:12px; border:1px solid rgba(255,255,255,0.14);
-  background:var(--panel); color:var(--txt);
-}}
-.controls {{ display:flex; flex-wrap:wrap; gap:8px; padding:10px 16px; align-items:center; border-bottom:1px solid var(--line); }}
-.controls .pill {{ background:var(--chip); border:1px solid var(--line); padding:8px 10px; border-radius:12px; display:flex; gap:8px; align-items:center; }}
-main {{ padding:12px 16px; }}
-.grid {{ display:grid; grid-template-columns: 1fr; gap:12px; }}
-.table-wrap {{ background:rgba(3,12,22,.55); border:1px solid var(--line); border-radius:14px; overflow:auto; }}
-table {{ width:100%; border-collapse:collapse; min-width:960px; }}
-th, td {{ padding:10px 12px; border-bottom:1px solid #12243a; text-align:left; }}
-th {{ position:sticky; top:0; background:#0c1b2f; z-index:1; cursor:pointer; }}
-td.price {{ text-align:right; white-space:nowrap; }}
-.rowlink a {{ color:#9aeed8; text-decoration:none; }}
-.meta {{ display:flex; gap:12px; align-items:center; flex-wrap:wrap; }}
-.kpi {{ padding:8px 10px; background:var(--chip); border:1px solid var(--line); border-radius:12px; }}
-footer {{ color:var(--muted); font-size:12px; text-align:center; padding:18px; }}
-.muted {{ color:var(--muted); }}
-details.admin {{ background:rgba(3,12,22,.4); border:1px solid var(--line); border-radius:12px; margin:10px 16px; padding:10px; }}
-details.admin summary {{ cursor:pointer; font-weight:700; }}
-.admin-grid {{ display:grid; grid-template-columns: repeat(auto-fit, minmax(260px, 1fr)); gap:14px; margin-top:8px; }}
-.admin-grid h4 {{ margin:.4rem 0 .6rem; }}
-.admin-grid input[type=file] {{ display:block; margin:.4rem 0; }}
-</style>
+<link rel="stylesheet" href="/static/digemid.min.css?v={_static_v('digemid.min.css')}">
 </head>
 <body>
   <div class="topbar">
@@ -3195,13 +4309,13 @@ details.admin summary {{ cursor:pointer; font-weight:700; }}
     <div>Búsqueda DIGEMID</div>
     <div class="version">v {APP_VERSION}</div>
     <div style="margin-left:auto; display:flex; gap:10px; align-items:center;">
-      <a href="{url_for('home')}" style="color:#9aeed8; text-decoration:none;">← Volver</a>
-      <span style="color:var(--muted); font-size:13px;">{user.get("username")} · {user.get("role")}</span>
-      <a href="{url_for('logout')}" style="color:#9aeed8; text-decoration:none;">Salir</a>
+      <a href="__SLOT__" style="color:#9aeed8; text-decoration:none;">← Volver</a>
+      <span style="color:var(--muted); font-size:13px;">__SLOT__</span>
+      <a href="__SLOT__" style="color:#9aeed8; text-decoration:none;">Salir</a>
     </div>
   </div>
 
-  {admin_panel}
+  __SLOT__
 
   <div class="controls">
     <div class="pill">
@@ -3233,7 +4347,7 @@ details.admin summary {{ cursor:pointer; font-weight:700; }}
       <button id="btnOpenMin" style="display:none;">Abrir (MENOR)</button>
       <div class="kpi" id="kpiMax">MAYOR: —</div>
       <button id="btnOpenMax" style="display:none;">Abrir (MAYOR)</button>
-      <div class="muted" id="lastMods" style="margin-left:auto;">Última modificación: {digemid_last}</div>
+      <div class="muted" id="lastMods" style="margin-left:auto;">Última modificación: __SLOT__</div>
       <div style="display:flex; gap:8px; align-items:center;">
         <button id="btnPrev">◀ Ant</button>
         <div class="kpi" id="kpiPage">Pág 0/0</div>
@@ -3439,14 +4553,32 @@ if (formDigemid) {{
 loadPage();
 </script>
 </body>
-</html>"""
+</html>""".split("__SLOT__")
+# Internadas: con gunicorn --preload los workers comparten estas páginas por COW
+_DIGEMID_PARTS = [sys.intern(_p) for _p in _DIGEMID_PARTS]
+
 
 # ---- Main
 if __name__ == "__main__":
-    ensure_all_files()
-    # Para desarrollo local - desactivar reloader si causa problemas
-    use_reloader = os.environ.get("FLASK_RELOAD", "true").lower() == "true"
-    app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), use_reloader=use_reloader)
+    # Debug apagado por defecto: el debugger + reloader de Werkzeug duplican
+    # el arranque (padre e hijo ejecutan ensure_all_files) y anulan caches
+    debug = os.environ.get("FLASK_DEBUG", "0") == "1"
+    use_reloader = debug and os.environ.get("FLASK_RELOAD", "true").lower() == "true"
+    if not use_reloader or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        ensure_all_files()
+    port = int(os.environ.get("PORT", 5000))
+    if debug:
+        app.run(debug=True, host="0.0.0.0", port=port,
+                use_reloader=use_reloader, threaded=True)
+    else:
+        # Sin debug se sirve con waitress (pool de hilos, paridad con
+        # gunicorn); si no está instalado se cae al servidor de Werkzeug
+        try:
+            from waitress import serve
+            serve(app, host="0.0.0.0", port=port,
+                  threads=int(os.environ.get("THREADS", "8")))
+        except ImportError:
+            app.run(host="0.0.0.0", port=port, threaded=True)
 else:
     # Para producción (cuando se ejecuta con gunicorn)
     ensure_all_files()